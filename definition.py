@@ -24,7 +24,7 @@ TOKEN = [
     ),
     (
         'cond_key',
-        re.compile('for|while|do|break|if|else')
+        re.compile('for|while|do|break|continue|if|else')
     ),
     (
         'key',
@@ -40,7 +40,7 @@ TOKEN = [
     ),
     (
         'op',
-        re.compile(r'\-\>|\&\&|\|\||\=\=|\!|\+|\-|\*|\/|\&|%|\\|\<|\<\=|\>|\>\=|\=|\!\=|\;|\,|\.|\[|\]|\(|\)|\{|\}')
+        re.compile(r'\-\>|\&\&|\|\||\=\=|\!\=|\<\=|\>\=|\!|\+|\-|\*|\/|\&|%|\\|\<|\>|\=|\;|\,|\.|\[|\]|\(|\)|\{|\}')
     ),
     (
         'ident',
@@ -242,94 +242,31 @@ SYNTAX = {
             (',', (',', 'Expr', 'ArgListRight'))
         ]
     },
-    # Expr -> Join ExprRight
+    # Expr -> Unary ExprRight
+    # the operators are folded into Binary nodes by OPERATOR_PRECEDENCE
     'Expr': {
         'empty': False,
         'derivations': [
-            ('ANY', ('Join', 'ExprRight'))
+            ('ANY', ('Unary', 'ExprRight'))
         ]
     },
-    # ExprRight -> "" | || Join ExprRight
+    # ExprRight -> "" | {||, &&, ==, !=, <, <=, >, >=, +, -, *, /}
+    #                   Unary ExprRight
     'ExprRight': {
         'empty': True,
         'derivations': [
-            ('||', ('||', 'Join', 'ExprRight'))
-        ]
-    },
-    # Join -> Equality JoinRight
-    'Join': {
-        'empty': False,
-        'derivations': [
-            ('ANY', ('Equality', 'JoinRight'))
-        ]
-    },
-    # JoinRight -> "" | && Equality
-    'JoinRight': {
-        'empty': True,
-        'derivations': [
-            ('&&', ('&&', 'Equality'))
-        ]
-    },
-    # Equality -> Rel EqualityRight
-    'Equality': {
-        'empty': False,
-        'derivations': [
-            ('ANY', ('Rel', 'EqualityRight'))
-        ]
-    },
-    # EqualityRight -> "" | {==, !=} Rel EqualityRight
-    'EqualityRight': {
-        'empty': True,
-        'derivations': [
-            ('==', ('==', 'Rel', 'EqualityRight')),
-            ('!=', ('!=', 'Rel', 'EqualityRight'))
-        ]
-    },
-    # Rel -> Arith RelRight
-    'Rel': {
-        'empty': False,
-        'derivations': [
-            ('ANY', ('Arith', 'RelRight'))
-        ]
-    },
-    # RelRight -> "" | {<, <=, >, >=} Arith RelRight
-    'RelRight': {
-        'empty': True,
-        'derivations': [
-            ('<', ('<', 'Arith', 'RelRight')),
-            ('<=', ('<=', 'Arith', 'RelRight')),
-            ('>', ('>', 'Arith', 'RelRight')),
-            ('>=', ('>=', 'Arith', 'RelRight'))
-        ]
-    },
-    # Arith -> Term ArithRight
-    'Arith': {
-        'empty': False,
-        'derivations': [
-            ('ANY', ('Term', 'ArithRight'))
-        ]
-    },
-    # ArithRight -> "" | {+, -} Term ArithRight
-    'ArithRight': {
-        'empty': True,
-        'derivations': [
-            ('+', ('+', 'Term', 'ArithRight')),
-            ('-', ('-', 'Term', 'ArithRight'))
-        ]
-    },
-    # Term -> Unary TermRight
-    'Term': {
-        'empty': False,
-        'derivations': [
-            ('ANY', ('Unary', 'TermRight'))
-        ]
-    },
-    # TermRight -> "" | {*, /} Unary TermRight
-    'TermRight': {
-        'empty': True,
-        'derivations': [
-            ('*', ('*', 'Unary', 'TermRight')),
-            ('/', ('/', 'Unary', 'TermRight'))
+            ('||', ('||', 'Unary', 'ExprRight')),
+            ('&&', ('&&', 'Unary', 'ExprRight')),
+            ('==', ('==', 'Unary', 'ExprRight')),
+            ('!=', ('!=', 'Unary', 'ExprRight')),
+            ('<', ('<', 'Unary', 'ExprRight')),
+            ('<=', ('<=', 'Unary', 'ExprRight')),
+            ('>', ('>', 'Unary', 'ExprRight')),
+            ('>=', ('>=', 'Unary', 'ExprRight')),
+            ('+', ('+', 'Unary', 'ExprRight')),
+            ('-', ('-', 'Unary', 'ExprRight')),
+            ('*', ('*', 'Unary', 'ExprRight')),
+            ('/', ('/', 'Unary', 'ExprRight'))
         ]
     },
     # Unary -> {+, -, !} Unary | ParExpr | Oprand
@@ -363,6 +300,17 @@ SYNTAX = {
 }
 
 
+# binding strength of binary operators, all of them are left-associative
+OPERATOR_PRECEDENCE = {
+    '||': 1,
+    '&&': 2,
+    '==': 3, '!=': 3,
+    '<': 4, '<=': 4, '>': 4, '>=': 4,
+    '+': 5, '-': 5,
+    '*': 6, '/': 6
+}
+
+
 class Check:
     def __init__(self, ok=True, msg=''):
         self.ok = ok
@@ -375,16 +323,72 @@ class Check:
         return Check(False, msg)
 
 
-# Decorator
-def MergeSymbols(f):
-    def g(symbols, node):
-        if node.function:
-            function_symbols = node.function.properties['symbols']
+class Scope:
+    # variables declared globally (no parent) or in a Function, a lookup
+    # walks up the parent chain; identifiers are interned to symbol ids
+    # shared by all the scopes of a program
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.types = {} # symbol id -> data type
+        self.slots = {} # symbol id -> index in this scope
+        if parent:
+            self.depth = parent.depth + 1
+            self.symbol_ids = parent.symbol_ids
+            self.names = parent.names
+            self.functions = parent.functions
         else:
-            function_symbols = {}
-        merged_symbols = {**symbols, **function_symbols}
-        return f(merged_symbols, node)
-    return g
+            self.depth = 0
+            self.symbol_ids = {} # ident -> symbol id
+            self.names = [] # symbol id -> ident
+            self.functions = {} # name -> {'parameters', 'return_type'}
+
+    def intern(self, ident):
+        symbol = self.symbol_ids.get(ident)
+        if symbol is None:
+            symbol = self.symbol_ids[ident] = len(self.names)
+            self.names.append(ident)
+        return symbol
+
+    def is_declared(self, ident):
+        return self.symbol_ids.get(ident) in self.types
+
+    def declare(self, ident, data_type):
+        symbol = self.intern(ident)
+        if symbol not in self.slots:
+            self.slots[symbol] = len(self.slots)
+        self.types[symbol] = data_type
+        return symbol
+
+    def lookup(self, ident):
+        # the scope declaring ident nearest to this one, or None
+        symbol = self.symbol_ids.get(ident)
+        scope = self
+        if symbol is not None:
+            while scope:
+                if symbol in scope.types:
+                    return scope
+                scope = scope.parent
+        return None
+
+
+def get_scope(symbols, node):
+    if node.function:
+        return node.function.properties['scope']
+    else:
+        return symbols
+
+
+def resolve(symbols, node, ident):
+    # record where ident is declared on node, False if it is not
+    scope = get_scope(symbols, node).lookup(ident)
+    if not scope:
+        return False
+    symbol = scope.symbol_ids[ident]
+    node.properties['data_type'] = scope.types[symbol]
+    node.properties['ident'] = ident
+    node.properties['symbol'] = symbol
+    node.properties['slot'] = (scope.depth, scope.slots[symbol])
+    return True
 
 
 class RULE:
@@ -402,37 +406,31 @@ class RULE:
         ident = node.children[1].token.string
         node.properties['data_type'] = data_type
         node.properties['ident'] = ident
-        if node.function:
-            active_symbols = node.function.properties['symbols']
-        else:
-            active_symbols = symbols
-        if not active_symbols.get(ident):
-            active_symbols[ident] = data_type
+        scope = get_scope(symbols, node)
+        if not scope.is_declared(ident):
+            symbol = scope.declare(ident, data_type)
+            node.properties['symbol'] = symbol
+            node.properties['slot'] = (scope.depth, scope.slots[symbol])
             return Check.Pass()
         else:
             return Check.Error('Duplicate definition for variable %s' % ident)
 
-    @MergeSymbols
     def Var(symbols, node):
         # Var -> ident VarRight
         ident = node.children[0].token.string
-        if symbols.get(ident):
-            node.properties['data_type'] = symbols[ident]
-            node.properties['ident'] = ident # todo: array
+        # todo: array
+        if resolve(symbols, node, ident):
             return Check.Pass()
         else:
             return Check.Error('Variable %s not defined' % ident)
 
-    @MergeSymbols
     def VarCall(symbols, node):
         # VarCall -> ident VarCallRight
         ident = node.children[0].token.string
         var_type = node.children[1].properties['var_type']
         node.properties['var_type'] = var_type
         if var_type == 'var':
-            if symbols.get(ident):
-                node.properties['data_type'] = symbols[ident]
-                node.properties['ident'] = ident
+            if resolve(symbols, node, ident):
                 return Check.Pass()
             else:
                 return Check.Error('Variable %s not defined' % ident)
@@ -440,8 +438,8 @@ class RULE:
             # todo: array
             pass
         elif var_type == 'call':
-            if symbols['_functions'].get(ident):
-                function_info = symbols['_functions'][ident]
+            if symbols.functions.get(ident):
+                function_info = symbols.functions[ident]
                 arg_types = node.children[1].properties['arg_types']
                 if function_info['parameters'] == arg_types:
                     node.properties['function_name'] = ident
@@ -549,95 +547,53 @@ class RULE:
         return Check.Pass()
 
     # Reuse Function
-    def SetNumberType(node, item, right):
-        if item.properties['data_type'] == 'void':
-            data_type = 'void'            
-        elif right.children and right.properties['data_type'] == 'void':
+    def GetOprandType(node):
+        # a bare operand passes the arithmetic level, turning bool into int
+        data_type = node.properties['data_type']
+        if node.syntax_item == 'Unary' and data_type == 'bool':
+            return 'int'
+        return data_type
+
+    # Reuse Function
+    def SetNumberType(node, left, right):
+        types = [RULE.GetOprandType(left), RULE.GetOprandType(right)]
+        if 'void' in types:
             data_type = 'void'
+        elif 'double' in types:
+            data_type = 'double'
         else:
-            if right.children:
-                if item.properties['data_type'] == 'double':
-                    data_type = 'double'
-                else:
-                    data_type = right.properties['data_type']
-            else:
-                if item.properties['data_type'] == 'bool':
-                    data_type = 'int'
-                else:
-                    data_type = item.properties['data_type']
+            data_type = 'int'
         node.properties['data_type'] = data_type
-        return Check.Pass()    
- 
-    def Term(symbols, node):
-        # Term -> Unary TermRight
-        unary = node.children[0]
-        right = node.children[-1]
-        return RULE.SetNumberType(node, unary, right)
-
-    def TermRight(symbols, node):
-        # TermRight -> "" | {*, /} Unary TermRight
-        if node.children:
-            unary = node.children[1]
-            right = node.children[-1]
-            return RULE.SetNumberType(node, unary, right)
-        else:
-            return Check.Pass()
-
-    def Arith(symbols, node):
-        # Arith -> Term ArithRight
-        term = node.children[0]
-        right = node.children[-1]        
-        return RULE.SetNumberType(node, term, right)
-        
-    def ArithRight(symbols, node):
-        # ArithRight -> "" | {+, -} Term ArithRight
-        if node.children:
-            term = node.children[1]
-            right = node.children[-1]        
-            return RULE.SetNumberType(node, term, right)
-        else:
-            return Check.Pass()
+        return Check.Pass()
 
     # Reuse Function
-    def SetBoolType(node):
-        if node.children:
-            item = node.children[0]
-            right = node.children[1]
-            if right.children:
-                item_type = item.properties['data_type']
-                right_type = right.children[1].properties['data_type']
-                if right_type == 'void' or item_type == 'void':
-                    node.properties['data_type'] = 'void'
-                else:
-                    node.properties['data_type'] = 'bool'
-            else:
-                node.properties['data_type'] = item.properties['data_type']
+    def SetBoolType(node, left, right):
+        types = [RULE.GetOprandType(left), RULE.GetOprandType(right)]
+        if 'void' in types:
+            node.properties['data_type'] = 'void'
+        else:
+            node.properties['data_type'] = 'bool'
         return Check.Pass()
 
-    def Rel(symbols, node):
-        # Rel -> Arith RelRight
-        return RULE.SetBoolType(node)
-
-    def Equality(symbols, node):
-        # Equality -> Rel EqualityRight
-        return RULE.SetBoolType(node)
-
-    def Join(symbols, node):
-        # Join -> Equality JoinRight
-        return RULE.SetBoolType(node)
+    def Binary(symbols, node):
+        # Binary -> Oprand op Oprand, folded from Expr
+        left = node.children[0]
+        right = node.children[2]
+        if node.children[1].token.string in ['+', '-', '*', '/']:
+            return RULE.SetNumberType(node, left, right)
+        else:
+            return RULE.SetBoolType(node, left, right)
 
     def Expr(symbols, node):
-        # Expr -> Join ExprRight
-        check = RULE.SetBoolType(node)
-        if check:
-            assert node.parent.deriv_tuple
-            is_eval = node.parent.deriv_tuple[0] == 'eval'
-            if node.properties['data_type'] == 'void' and not is_eval:
-                return Check.Error('Void expression in calculation')
-            else:
-                return Check.Pass()
+        # Expr -> Unary | Binary, folded from Expr -> Unary ExprRight
+        item = node.children[0]
+        node.properties['data_type'] = RULE.GetOprandType(item)
+        assert node.parent.deriv_tuple
+        is_eval = node.parent.deriv_tuple[0] == 'eval'
+        if node.properties['data_type'] == 'void' and not is_eval:
+            return Check.Error('Void expression in calculation')
         else:
-            return check
+            return Check.Pass()
 
     def Stmt(symbols, node):
         # Stmt -> Assign; |
@@ -699,7 +655,7 @@ class RULE:
         data_type = node.children[1].properties['data_type']
         node.properties['return_type'] = data_type
         name = node.function.children[1].token.string
-        symbols['_functions'][name]['return_type'] = data_type
+        symbols.functions[name]['return_type'] = data_type
         return Check.Pass()
 
     def Function(symbols, node):
@@ -718,8 +674,8 @@ class RULE:
         node.properties['name'] = name
         node.properties['para_list'] = para_list
         node.properties['return_type'] = detect_type
-        assert symbols['_functions'].get(name)
-        symbols['_functions'][name]['return_type'] = detect_type
+        assert symbols.functions.get(name)
+        symbols.functions[name]['return_type'] = detect_type
         return Check.Pass()
         
     def ParaListRight(symbols, node):
@@ -751,10 +707,10 @@ class RULE:
             )
         node.properties['para_list'] = para_list
         for para_type, para_name in para_list:
-            node.function.properties['symbols'][para_name] = para_type
+            node.function.properties['scope'].declare(para_name, para_type)
         name = node.function.children[1].token.string
-        if not symbols['_functions'].get(name):
-            symbols['_functions'][name] = {
+        if not symbols.functions.get(name):
+            symbols.functions[name] = {
                 'parameters': tuple(p[0] for p in para_list)
             }
         else:
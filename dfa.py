@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import json
+import hashlib
+from definition import TOKEN
+
+
+# bump when the table format changes
+VERSION = 1
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+# code points from here on share one character class
+OTHER = 128
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r'}
+
+
+class RegexError(Exception):
+    def __init__(self, pattern, msg):
+        self.pattern = pattern
+        self.msg = msg
+    def __str__(self):
+        return '%s: %s' % (self.pattern, self.msg)
+
+
+class RegexParser:
+    # parses the subset of re syntax used in definition.TOKEN into
+    # ('set', negated, chars) | ('cat', items) | ('alt', items) |
+    # ('star', item) | ('plus', item) | ('opt', item)
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def error(self, msg):
+        raise RegexError(self.pattern, '%s at %d' % (msg, self.pos))
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def next(self):
+        char = self.peek()
+        if char is None:
+            self.error('Unexpected end')
+        self.pos += 1
+        return char
+
+    def parse(self):
+        node = self.parse_alt()
+        if self.peek() is not None:
+            self.error('Unbalanced parenthesis')
+        return node
+
+    def parse_alt(self):
+        items = [self.parse_cat()]
+        while self.peek() == '|':
+            self.pos += 1
+            items.append(self.parse_cat())
+        return items[0] if len(items) == 1 else ('alt', items)
+
+    def parse_cat(self):
+        items = []
+        while self.peek() not in [None, '|', ')']:
+            items.append(self.parse_repeat())
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def parse_repeat(self):
+        node = self.parse_atom()
+        while self.peek() in ['*', '+', '?']:
+            node = ({'*': 'star', '+': 'plus', '?': 'opt'}[self.next()], node)
+            if self.peek() == '?':
+                self.error('Lazy quantifier not supported')
+        return node
+
+    def parse_escape(self):
+        char = self.next()
+        if char in ESCAPES:
+            return ESCAPES[char]
+        elif char.isalnum():
+            self.error('Escape \\%s not supported' % char)
+        return char
+
+    def parse_atom(self):
+        char = self.next()
+        if char == '(':
+            if self.peek() == '?':
+                self.pos += 1
+                if self.next() != ':':
+                    self.error('Group extension not supported')
+            node = self.parse_alt()
+            if self.next() != ')':
+                self.error('Unbalanced parenthesis')
+            return node
+        elif char == '[':
+            return self.parse_class()
+        elif char == '.':
+            return ('set', True, frozenset('\n'))
+        elif char == '\\':
+            return ('set', False, frozenset(self.parse_escape()))
+        elif char in ['*', '+', '?', '{', '^', '$']:
+            self.error('Unexpected %s' % char)
+        return ('set', False, frozenset(char))
+
+    def parse_class(self):
+        negated = False
+        if self.peek() == '^':
+            negated = True
+            self.pos += 1
+        chars = set()
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            char = self.next()
+            if char == '\\':
+                char = self.parse_escape()
+            if self.peek() == '-' and self.pattern[self.pos+1:self.pos+2] != ']':
+                self.pos += 1
+                last = self.next()
+                if last == '\\':
+                    last = self.parse_escape()
+                chars.update(chr(c) for c in range(ord(char), ord(last)+1))
+            else:
+                chars.add(char)
+        self.pos += 1
+        return ('set', negated, frozenset(chars))
+
+
+class NFA:
+    # states are ('set', negated, chars, next) | ('split', [next, ...]) |
+    # ('match', token_id); split targets are listed by priority
+    def __init__(self):
+        self.states = []
+
+    def add(self, state):
+        self.states.append(state)
+        return len(self.states)-1
+
+    def compile(self, node, next_state):
+        kind = node[0]
+        if kind == 'set':
+            return self.add(('set', node[1], node[2], next_state))
+        elif kind == 'cat':
+            for item in reversed(node[1]):
+                next_state = self.compile(item, next_state)
+            return next_state
+        elif kind == 'alt':
+            return self.add(
+                ('split', [self.compile(item, next_state) for item in node[1]])
+            )
+        elif kind in ['star', 'plus']:
+            # greedy: prefer another round of the body over leaving
+            loop = self.add(None)
+            body = self.compile(node[1], loop)
+            self.states[loop] = ('split', [body, next_state])
+            return loop if kind == 'star' else body
+        elif kind == 'opt':
+            return self.add(
+                ('split', [self.compile(node[1], next_state), next_state])
+            )
+        else:
+            assert False
+
+    def closure(self, roots, result, seen):
+        # depth-first in priority order, the first path to a state wins
+        stack = list(reversed(roots))
+        while stack:
+            state_id = stack.pop()
+            if state_id in seen:
+                continue
+            seen.add(state_id)
+            state = self.states[state_id]
+            if state[0] == 'split':
+                stack.extend(reversed(state[1]))
+            else:
+                result.append(state_id)
+        return result
+
+
+def get_token_nfa(token_list):
+    nfa = NFA()
+    roots = []
+    for token_id, (token_type, regex) in enumerate(token_list):
+        node = RegexParser(regex.pattern).parse()
+        roots.append(nfa.compile(node, nfa.add(('match', token_id))))
+    return nfa, nfa.add(('split', roots))
+
+
+def get_char_classes(nfa):
+    char_sets = [s for s in nfa.states if s and s[0] == 'set']
+    for state in char_sets:
+        if any(ord(c) >= OTHER for c in state[2]):
+            raise RegexError(str(state[2]), 'Non-ASCII character in pattern')
+    def contains(state, code):
+        return (code < OTHER and chr(code) in state[2]) != state[1]
+    signatures = {}
+    classes = []
+    for code in range(0, OTHER+1):
+        signature = tuple(contains(state, code) for state in char_sets)
+        classes.append(signatures.setdefault(signature, len(signatures)))
+    return classes, len(signatures)
+
+
+def build_tables(token_list):
+    # subset construction with leftmost-first semantics: a DFA state is
+    # the priority-ordered list of live NFA states, cut after the first
+    # match because lower-priority threads can no longer win, which makes
+    # the result identical to trying the alternation with re
+    nfa, start = get_token_nfa(token_list)
+    classes, class_count = get_char_classes(nfa)
+    representative = {}
+    for code, char_class in enumerate(classes):
+        representative.setdefault(char_class, code)
+    def cut(state_list):
+        for i, state_id in enumerate(state_list):
+            if nfa.states[state_id][0] == 'match':
+                return tuple(state_list[:i+1])
+        return tuple(state_list)
+    start_key = cut(nfa.closure([start], [], set()))
+    state_index = {start_key: 0}
+    keys = [start_key]
+    trans = []
+    accept = []
+    i = 0
+    while i < len(keys):
+        key = keys[i]
+        last = nfa.states[key[-1]] if key else None
+        accept.append(last[1] if last and last[0] == 'match' else -1)
+        for char_class in range(0, class_count):
+            code = representative[char_class]
+            result = []
+            seen = set()
+            for state_id in key:
+                state = nfa.states[state_id]
+                if state[0] != 'set':
+                    continue
+                if (code < OTHER and chr(code) in state[2]) != state[1]:
+                    nfa.closure([state[3]], result, seen)
+            next_key = cut(result)
+            if not next_key:
+                trans.append(-1)
+                continue
+            if next_key not in state_index:
+                state_index[next_key] = len(keys)
+                keys.append(next_key)
+            trans.append(state_index[next_key])
+        i += 1
+    return {
+        'version': VERSION,
+        'token_types': [token_type for token_type, regex in token_list],
+        'classes': classes,
+        'class_count': class_count,
+        'trans': trans,
+        'accept': accept
+    }
+
+
+def get_token_hash(token_list):
+    definition = json.dumps(
+        [VERSION, [(t, regex.pattern) for t, regex in token_list]]
+    )
+    return hashlib.sha1(definition.encode()).hexdigest()
+
+
+def get_cache_file(token_list):
+    return os.path.join(
+        CACHE_DIR, 'lexer-dfa-%s.json' % get_token_hash(token_list)
+    )
+
+
+def load_tables(token_list=TOKEN):
+    cache_file = get_cache_file(token_list)
+    try:
+        with open(cache_file, 'r') as f:
+            tables = json.load(f)
+        if tables.get('version') == VERSION:
+            return tables
+    except (OSError, ValueError):
+        pass
+    tables = build_tables(token_list)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp_file = '%s.%d' % (cache_file, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(tables, f)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        pass
+    return tables
+
+
+def main():
+    tables = build_tables(TOKEN)
+    print(
+        '%d states, %d character classes'
+        % (len(tables['accept']), tables['class_count'])
+    )
+    print('cache: %s' % get_cache_file(TOKEN))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+
+import re
+import json
+import hashlib
+from array import array
+from definition import TOKEN, SYNTAX
+
+
+# table entries besides production ids
+EMPTY = -1
+ERROR = -2
+
+
+def classify_symbol(string):
+    if re.match('[A-Z]', string):
+        return 'non-terminal'
+    for token_type, regex in TOKEN:
+        if string == token_type:
+            return 'token_type'
+    return 'string'
+
+
+def get_symbols(syntax):
+    symbols = []
+    def add(symbol):
+        if symbol not in symbols:
+            symbols.append(symbol)
+    for non_terminal, rule in syntax.items():
+        add(non_terminal)
+        if rule.get('follow'):
+            add(rule['follow'])
+        for first, deriv_tuple in rule['derivations']:
+            if first != 'ANY':
+                add(first)
+            for item in deriv_tuple:
+                add(item)
+    return symbols
+
+
+def get_kinds(syntax):
+    return {symbol: classify_symbol(symbol) for symbol in get_symbols(syntax)}
+
+
+def get_grammar_hash(syntax=SYNTAX, token_list=TOKEN):
+    definition = json.dumps(
+        [syntax, [(t, regex.pattern) for t, regex in token_list]],
+        sort_keys=True
+    )
+    return hashlib.sha1(definition.encode()).hexdigest()
+
+
+class ParseTable:
+    # SYNTAX compiled for the parser: every symbol is classified once,
+    # non-terminals and terminals are numbered and the expansion for a
+    # (non-terminal, terminal) pair is a single array lookup
+    def __init__(self, syntax=SYNTAX, token_list=TOKEN):
+        symbols = get_symbols(syntax)
+        self.kind = get_kinds(syntax)
+        self.non_terminals = list(syntax)
+        self.non_terminal_id = {
+            item: i for i, item in enumerate(self.non_terminals)
+        }
+        token_types = [token_type for token_type, regex in token_list]
+        keywords = [s for s in symbols if self.kind[s] == 'string']
+        # a terminal is a token type, or a token type together with a
+        # keyword because derivations may select on either of them
+        self.terminals = [(token_type, None) for token_type in token_types]
+        self.terminals += [
+            (token_type, keyword)
+            for token_type in token_types for keyword in keywords
+        ]
+        self.terminal_id = {
+            terminal: i for i, terminal in enumerate(self.terminals)
+        }
+        self.token_type_id = {
+            token_type: i for i, token_type in enumerate(token_types)
+        }
+        self.productions = []
+        production_id = {}
+        for rule in syntax.values():
+            for first, deriv_tuple in rule['derivations']:
+                if deriv_tuple not in production_id:
+                    production_id[deriv_tuple] = len(self.productions)
+                    self.productions.append(deriv_tuple)
+        self.terminal_count = len(self.terminals)
+        self.table = array('h')
+        for non_terminal in self.non_terminals:
+            rule = syntax[non_terminal]
+            for terminal in self.terminals:
+                deriv_tuple = self.predict(rule, terminal)
+                if deriv_tuple is None:
+                    self.table.append(EMPTY if rule['empty'] else ERROR)
+                else:
+                    self.table.append(production_id[deriv_tuple])
+
+    def matches(self, symbol, terminal):
+        token_type, string = terminal
+        if self.kind[symbol] == 'token_type':
+            return symbol == token_type
+        else:
+            return symbol == string
+
+    def predict(self, rule, terminal):
+        # the choice the grammar makes by trying derivations in order
+        if rule.get('follow') and self.matches(rule['follow'], terminal):
+            return None
+        for first, deriv_tuple in rule['derivations']:
+            if first == 'ANY' or self.matches(first, terminal):
+                return deriv_tuple
+        return None
+
+    def get_terminal_id(self, token):
+        terminal_id = self.terminal_id.get((token.token_type, token.string))
+        if terminal_id is None:
+            return self.token_type_id[token.token_type]
+        return terminal_id
+
+    def expand(self, non_terminal, token):
+        return self.table[
+            self.non_terminal_id[non_terminal] * self.terminal_count
+            + self.get_terminal_id(token)
+        ]
+
+
+def main():
+    table = ParseTable()
+    print(
+        '%d non-terminals, %d terminals, %d productions'
+        % (len(table.non_terminals), table.terminal_count,
+           len(table.productions))
+    )
+
+
+if __name__ == '__main__':
+    main()
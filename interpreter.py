@@ -3,23 +3,19 @@
 
 import sys
 from machine import Machine
-from translator import translate
-from syntax import get_syntax_tree
+from translator import compile_file
+from optimizer import optimize
 
 
 def main():
     machine = Machine()
-    if len(sys.argv) > 1:
-        code_file = sys.argv[1]
-        f = open(code_file, 'r')
-        machine.run(
-            translate(
-                get_syntax_tree(
-                    f.read()
-                )
-            )
-        )
-        f.close()
+    optimized = '-O' in sys.argv[1:]
+    file_names = [arg for arg in sys.argv[1:] if arg != '-O']
+    if file_names:
+        code = compile_file(file_names[0])
+        if optimized:
+            code = optimize(code)
+        machine.run(code)
 
 
 if __name__ == '__main__':
@@ -21,12 +21,29 @@ CALCULATION = {
 }
 
 
+# goto_lt x y L jumps to L if lt would store true for x and y
+BRANCH = {
+    'goto_gt': 'gt',
+    'goto_lt': 'lt',
+    'goto_ge': 'ge',
+    'goto_le': 'le',
+    'goto_eq': 'eq',
+    'goto_neq': 'neq'
+}
+# relation holding exactly when the other does not, a comparison with a
+# double NaN is false either way, so only eq and neq negate doubles
+NEGATED = {
+    'lt': 'ge', 'ge': 'lt', 'gt': 'le', 'le': 'gt',
+    'eq': 'neq', 'neq': 'eq'
+}
+
+
 OPERATION = [
     'start',    
     'read', 'print',
-    'proc', 'end', 'call', 'ret', 'exit',
+    'proc', 'end', 'call', 'tailcall', 'ret', 'exit',
     'static', 'alloc', 'override', 'mov',
-    'label', 'goto', 'goto_if', 'goto_if_false'
+    'label', 'goto', 'goto_if', 'goto_if_false', *BRANCH
 ]
 
 
@@ -259,6 +276,19 @@ class Machine:
                     raise RuntimeError(
                         inst, '%s: Procedure does not exist' % arg1
                     )
+            elif cmd == 'tailcall':
+                # the frame of the current procedure is reused, so the
+                # callee returns to the caller of the current one
+                if is_in_stack():
+                    call_stack[-1]['var_dict'] = {'_type':{}}
+                else:
+                    raise RuntimeError(inst, 'Unable to reuse heap as frame')
+                if proc_dict.get(arg1) is not None:
+                    i = proc_dict[arg1]
+                else:
+                    raise RuntimeError(
+                        inst, '%s: Procedure does not exist' % arg1
+                    )
             elif cmd == 'ret':
                 if is_in_stack():
                     not_void = stack_var_dict.get(RETVAL) is not None
@@ -281,10 +311,15 @@ class Machine:
                     i = last_call['pos']
                 else:
                     raise RuntimeError(inst, 'Unable to pop from call stack')
-            elif cmd in ['goto', 'goto_if', 'goto_if_false']:
+            elif cmd in ['goto', 'goto_if', 'goto_if_false', *BRANCH]:
                 if cmd == 'goto':
                     condition = True
                     label_name = arg1
+                elif cmd in BRANCH:
+                    condition = CALCULATION[BRANCH[cmd]](
+                        arg1.val(var_dict), arg2.val(var_dict)
+                    )
+                    label_name = arg3
                 else:
                     condition = arg1.val(var_dict)
                     if cmd == 'goto_if_false':
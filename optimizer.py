@@ -0,0 +1,1358 @@
+#!/usr/bin/env python3
+
+
+import sys
+import itertools
+from machine import (
+    Instruction, Argument, CALCULATION, BRANCH, NEGATED,
+    RETVAL, GETVAL, ARG_PREFIX, TEMP_PREFIX
+)
+
+
+JUMPS = ['goto', 'goto_if', 'goto_if_false', *BRANCH]
+CALLS = ['call', 'tailcall']
+# instructions control never passes over
+LEAVES = ['goto', 'ret', 'exit', 'tailcall']
+BLOCK_ENDS = [*JUMPS, 'ret', 'exit', 'tailcall']
+# argument slots an instruction reads
+USES = {
+    'mov': ['arg2'],
+    'override': ['arg2'],
+    'print': ['arg1'],
+    'goto_if': ['arg1'],
+    'goto_if_false': ['arg1'],
+    **{cmd: ['arg1', 'arg2'] for cmd in BRANCH},
+    **{cmd: ['arg2', 'arg3'] for cmd in CALCULATION}
+}
+# instructions writing arg1
+DEFINES = ['mov', 'read', *CALCULATION]
+# calculations giving the same value for swapped operands
+COMMUTATIVE = ['plus', 'mul', 'eq', 'neq']
+MAX_ROUNDS = 10
+# instructions in the body of a procedure to inline at its calls
+INLINE_SIZE = 12
+
+
+def is_ident(arg):
+    return isinstance(arg, Argument) and arg.arg_type == 'ident'
+
+
+def is_temp(arg):
+    return is_ident(arg) and arg.ident.startswith(TEMP_PREFIX)
+
+
+def get_uses(inst):
+    return [
+        getattr(inst, slot) for slot in USES.get(inst.cmd, [])
+        if is_ident(getattr(inst, slot))
+    ]
+
+
+def get_target(inst):
+    if inst.cmd == 'goto':
+        return inst.arg1
+    return inst.arg3 if inst.cmd in BRANCH else inst.arg2
+
+
+def set_target(inst, label):
+    if inst.cmd == 'goto':
+        inst.arg1 = label
+    elif inst.cmd in BRANCH:
+        inst.arg3 = label
+    else:
+        inst.arg2 = label
+
+
+def get_defined(inst):
+    # the name an instruction writes, None if it writes none
+    if inst.cmd in DEFINES or inst.cmd == 'override':
+        return inst.arg1.ident
+    if inst.cmd == 'alloc':
+        return inst.arg2
+    return None
+
+
+def may_fail(inst):
+    # a division fails at runtime unless it divides by a constant other
+    # than 0, so it stays even when its value is not needed
+    return inst.cmd == 'div' and not (
+        inst.arg3.arg_type == 'data' and inst.arg3.val({}) != 0
+    )
+
+
+def split_procs(code):
+    # [(name, instructions)], name is None for code outside procedures
+    segments = []
+    name = None
+    for inst in code:
+        if inst.cmd == 'proc':
+            name = inst.arg1
+            segments.append((name, []))
+        elif name is None and (not segments or segments[-1][0] is not None):
+            segments.append((None, []))
+        segments[-1][1].append(inst)
+        if inst.cmd == 'end':
+            name = None
+    return segments
+
+
+def remove_uncalled(segments):
+    # procedures reachable by calls from the code outside procedures
+    calls = {}
+    for name, insts in segments:
+        calls.setdefault(name, set()).update(
+            inst.arg1 for inst in insts if inst.cmd in CALLS
+        )
+    reached = set()
+    todo = list(calls[None]) if None in calls else []
+    while todo:
+        name = todo.pop()
+        if name not in reached:
+            reached.add(name)
+            todo += calls.get(name, [])
+    return [
+        (name, insts) for name, insts in segments
+        if name is None or name in reached
+    ]
+
+
+def get_blocks(insts):
+    blocks = [[]]
+    for inst in insts:
+        if inst.cmd == 'label' and blocks[-1]:
+            blocks.append([])
+        blocks[-1].append(inst)
+        if inst.cmd in BLOCK_ENDS:
+            blocks.append([])
+    if not blocks[-1]:
+        blocks.pop()
+    return blocks
+
+
+def get_successors(blocks):
+    label_block = {
+        block[0].arg1: i for i, block in enumerate(blocks)
+        if block and block[0].cmd == 'label'
+    }
+    successors = []
+    for i, block in enumerate(blocks):
+        result = []
+        if not block:
+            # emptied by a pass, falls through
+            successors.append([i+1] if i+1 < len(blocks) else [])
+            continue
+        last = block[-1]
+        if last.cmd in JUMPS and get_target(last) in label_block:
+            result.append(label_block[get_target(last)])
+        if last.cmd not in LEAVES and i+1 < len(blocks):
+            result.append(i+1)
+        successors.append(result)
+    return successors
+
+
+def evaluate(inst):
+    # the value an instruction on constant operands stores, None if it
+    # is not constant; the value is kept as the machine stores it and
+    # converted by the data type of each use like Argument.val does
+    args = [getattr(inst, slot) for slot in USES[inst.cmd]]
+    if any(arg is not None and arg.arg_type != 'data' for arg in args):
+        return None
+    try:
+        if inst.cmd in ['mov', 'override']:
+            return inst.arg2.val({})
+        return CALCULATION[inst.cmd](
+            inst.arg2.val({}), inst.arg3 and inst.arg3.val({})
+        )
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+
+def propagate(block, local_names):
+    # fold and propagate constants of temps, locals and arguments through
+    # a block, globals may not exist and are left to the machine
+    values = {}
+    changed = False
+    for i, inst in enumerate(block):
+        for slot in USES.get(inst.cmd, []):
+            arg = getattr(inst, slot)
+            if is_ident(arg) and arg.ident in values:
+                setattr(
+                    inst, slot,
+                    Argument('data', arg.data_type, values[arg.ident])
+                )
+                changed = True
+        cmd = inst.cmd
+        if cmd == 'alloc':
+            values[inst.arg2] = inst.arg3.val({})
+        elif cmd == 'override':
+            value = evaluate(inst)
+            if value is None:
+                values.pop(inst.arg1.ident, None)
+            else:
+                values[inst.arg1.ident] = value
+        elif cmd == 'call':
+            # the callee may override arguments as well
+            for ident in list(values):
+                if ident.startswith(ARG_PREFIX):
+                    del values[ident]
+        elif cmd in DEFINES:
+            target = inst.arg1.ident
+            values.pop(target, None)
+            if cmd == 'read':
+                continue
+            if not (target.startswith(TEMP_PREFIX) or target in local_names):
+                continue
+            value = evaluate(inst)
+            if value is None:
+                continue
+            values[target] = value
+            if cmd in CALCULATION:
+                block[i] = Instruction(
+                    'mov', inst.arg1,
+                    Argument('data', inst.arg1.data_type, value)
+                )
+                changed = True
+    return changed
+
+
+def number_values(block, local_names):
+    # local value numbering: a calculation repeating an earlier one on
+    # operands that still hold the same values is not needed, the reads
+    # of its temp read the earlier temp instead; both are stored raw, a
+    # mov would convert the value and a variable is type checked by mov
+    numbers = {}
+    results = {}
+    copies = {} # temp -> earlier temp holding the same value
+    counter = itertools.count()
+    changed = False
+    def get_number(arg):
+        if arg.arg_type == 'data':
+            return (type(arg.data).__name__, arg.data)
+        if arg.ident not in numbers:
+            numbers[arg.ident] = next(counter)
+        return numbers[arg.ident]
+    def kill(name):
+        numbers[name] = next(counter)
+        for temp, holder in list(copies.items()):
+            if name in [temp, holder]:
+                del copies[temp]
+    kept = []
+    for inst in block:
+        kept.append(inst)
+        for slot in USES.get(inst.cmd, []):
+            arg = getattr(inst, slot)
+            if is_ident(arg) and arg.ident in copies:
+                setattr(
+                    inst, slot,
+                    Argument('ident', arg.data_type, copies[arg.ident])
+                )
+                changed = True
+        if inst.cmd in CALCULATION:
+            operands = [
+                (get_number(arg), arg.data_type)
+                for arg in [inst.arg2, inst.arg3] if arg is not None
+            ]
+            if inst.cmd in COMMUTATIVE:
+                operands.sort(key=repr)
+            key = (inst.cmd, *operands)
+            target = inst.arg1.ident
+            number, holder = results.get(key, (None, None))
+            if number is None or numbers.get(holder) != number:
+                kill(target)
+                results[key] = (numbers[target], target)
+            elif holder == target:
+                # the target holds the value already
+                kept.pop()
+                changed = True
+            else:
+                kill(target)
+                numbers[target] = number
+                if is_temp(inst.arg1) and holder.startswith(TEMP_PREFIX):
+                    copies[target] = holder
+        elif inst.cmd == 'call':
+            # the callee may write globals and arguments, not the frame
+            for name in list(numbers):
+                if not (name.startswith(TEMP_PREFIX) or name in local_names):
+                    kill(name)
+        elif get_defined(inst) is not None:
+            kill(get_defined(inst))
+    block[:] = kept
+    return changed
+
+
+def resolve_branches(blocks):
+    changed = False
+    for block in blocks:
+        last = block[-1] if block else None
+        if last and last.cmd in JUMPS and last.cmd != 'goto':
+            args = [getattr(last, slot) for slot in USES[last.cmd]]
+            if any(arg.arg_type != 'data' for arg in args):
+                continue
+            if last.cmd in BRANCH:
+                condition = CALCULATION[BRANCH[last.cmd]](
+                    *[arg.val({}) for arg in args]
+                )
+            else:
+                condition = last.arg1.val({})
+            if last.cmd == 'goto_if_false':
+                condition = not condition
+            if condition:
+                block[-1] = Instruction('goto', get_target(last))
+            else:
+                block.pop()
+            changed = True
+    return changed
+
+
+def remove_unreachable(blocks):
+    successors = get_successors(blocks)
+    reached = {0}
+    todo = [0]
+    while todo:
+        for successor in successors[todo.pop()]:
+            if successor not in reached:
+                reached.add(successor)
+                todo.append(successor)
+    changed = False
+    for i, block in enumerate(blocks):
+        if i not in reached:
+            kept = [inst for inst in block if inst.cmd in ['proc', 'end']]
+            changed = changed or len(kept) != len(block)
+            block[:] = kept
+    return changed
+
+
+def get_live_out(blocks, successors):
+    # temps live at the end of each block
+    gen = []
+    kill = []
+    for block in blocks:
+        used = set()
+        defined = set()
+        for inst in block:
+            for arg in get_uses(inst):
+                if is_temp(arg) and arg.ident not in defined:
+                    used.add(arg.ident)
+            if inst.cmd in DEFINES and is_temp(inst.arg1):
+                defined.add(inst.arg1.ident)
+        gen.append(used)
+        kill.append(defined)
+    live_in = [set() for block in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for i in reversed(range(0, len(blocks))):
+            live_out = set()
+            for successor in successors[i]:
+                live_out |= live_in[successor]
+            live = gen[i] | (live_out - kill[i])
+            if live != live_in[i]:
+                live_in[i] = live
+                changed = True
+    live_out = []
+    for i in range(0, len(blocks)):
+        live = set()
+        for successor in successors[i]:
+            live |= live_in[successor]
+        live_out.append(live)
+    return live_out
+
+
+def get_live_after(insts):
+    # temps live after each instruction
+    blocks = get_blocks(insts)
+    live_after = []
+    for block, live_out in zip(
+            blocks, get_live_out(blocks, get_successors(blocks))
+    ):
+        live = set(live_out)
+        result = []
+        for inst in reversed(block):
+            result.append(frozenset(live))
+            if inst.cmd in DEFINES and is_temp(inst.arg1):
+                live.discard(inst.arg1.ident)
+            for arg in get_uses(inst):
+                if is_temp(arg):
+                    live.add(arg.ident)
+        live_after += reversed(result)
+    return live_after
+
+
+def remove_dead_temps(blocks):
+    # a temp written but not read before its next write is dead
+    blocks = [block for block in blocks if block]
+    live_out = get_live_out(blocks, get_successors(blocks))
+    removed = False
+    for i, block in enumerate(blocks):
+        live = set(live_out[i])
+        kept = []
+        for inst in reversed(block):
+            if inst.cmd in DEFINES and is_temp(inst.arg1):
+                target = inst.arg1.ident
+                if (
+                        target not in live and inst.cmd != 'read'
+                        and not may_fail(inst)
+                ):
+                    removed = True
+                    continue
+                live.discard(target)
+            for arg in get_uses(inst):
+                if is_temp(arg):
+                    live.add(arg.ident)
+            kept.append(inst)
+        block[:] = reversed(kept)
+    return removed
+
+
+def remove_unused_labels(insts):
+    targets = {get_target(inst) for inst in insts if inst.cmd in JUMPS}
+    kept = [
+        inst for inst in insts
+        if inst.cmd != 'label' or inst.arg1 in targets
+    ]
+    return kept, len(kept) != len(insts)
+
+
+def optimize_proc(insts):
+    local_names = {inst.arg2 for inst in insts if inst.cmd == 'alloc'}
+    for i in range(0, MAX_ROUNDS):
+        insts, changed = remove_unused_labels(insts)
+        blocks = get_blocks(insts)
+        for block in blocks:
+            changed = propagate(block, local_names) or changed
+            changed = number_values(block, local_names) or changed
+        changed = resolve_branches(blocks) or changed
+        changed = remove_unreachable(blocks) or changed
+        changed = remove_dead_temps(blocks) or changed
+        insts = [inst for block in blocks for inst in block]
+        if not changed:
+            break
+    return insts
+
+
+def get_names(code):
+    names = set()
+    for inst in code:
+        if inst.cmd in ['alloc', 'static']:
+            names.add(inst.arg2)
+        for arg in [inst.arg1, inst.arg2, inst.arg3]:
+            if is_ident(arg):
+                names.add(arg.ident)
+    return names
+
+
+def get_fresh(base, used):
+    name = base
+    index = 0
+    while name in used:
+        index += 1
+        name = '%s%d' % (base, index)
+    used.add(name)
+    return name
+
+
+def get_free_names(body):
+    # globals a procedure refers to
+    local_names = {inst.arg2 for inst in body if inst.cmd == 'alloc'}
+    free_names = set()
+    for inst in body:
+        for arg in [inst.arg1, inst.arg2, inst.arg3]:
+            if (
+                    is_ident(arg) and not is_temp(arg)
+                    and not arg.ident.startswith(ARG_PREFIX)
+                    and arg.ident != GETVAL and arg.ident not in local_names
+            ):
+                free_names.add(arg.ident)
+    return free_names
+
+
+def copy_arg(arg, renamed):
+    if not isinstance(arg, Argument):
+        return arg
+    if arg.arg_type == 'data':
+        return Argument('data', arg.data_type, arg.data)
+    return Argument('ident', arg.data_type, renamed.get(arg.ident, arg.ident))
+
+
+def expand_call(name, body, names, labels):
+    # the body of a procedure for one call site, its locals and temps
+    # stay in the frame of the caller under new names and ret jumps
+    # behind the body; the arguments are still passed through _arg
+    renamed = {}
+    for inst in body:
+        if inst.cmd == 'alloc':
+            renamed[inst.arg2] = get_fresh('_in_%s_%s' % (name, inst.arg2), names)
+        for arg in [inst.arg1, inst.arg2, inst.arg3]:
+            if is_temp(arg) and arg.ident not in renamed:
+                renamed[arg.ident] = get_fresh(
+                    '%s%s_%s' % (TEMP_PREFIX, name, arg.ident[len(TEMP_PREFIX):]),
+                    names
+                )
+    renamed_labels = {
+        inst.arg1: get_fresh('%s_%s' % (inst.arg1, name), labels)
+        for inst in body if inst.cmd == 'label'
+    }
+    exit_label = get_fresh('%s_exit' % name, labels)
+    code = []
+    for inst in body:
+        cmd = inst.cmd
+        if cmd == 'ret':
+            code.append(Instruction('goto', exit_label))
+        elif cmd == 'alloc':
+            code.append(Instruction(
+                'alloc', inst.arg1, renamed[inst.arg2],
+                copy_arg(inst.arg3, renamed)
+            ))
+        elif cmd == 'label' or cmd == 'goto':
+            code.append(Instruction(
+                cmd, renamed_labels.get(inst.arg1, inst.arg1)
+            ))
+        elif cmd in JUMPS:
+            jump = Instruction(cmd, *[
+                copy_arg(arg, renamed)
+                for arg in [inst.arg1, inst.arg2, inst.arg3]
+            ])
+            label = get_target(inst)
+            set_target(jump, renamed_labels.get(label, label))
+            code.append(jump)
+        else:
+            code.append(Instruction(cmd, *[
+                copy_arg(arg, renamed)
+                for arg in [inst.arg1, inst.arg2, inst.arg3]
+            ]))
+    code.append(Instruction('label', exit_label))
+    return code, renamed
+
+
+def inline_calls(insts, bodies, names, labels):
+    local_names = {inst.arg2 for inst in insts if inst.cmd == 'alloc'}
+    result = []
+    i = 0
+    while i < len(insts):
+        inst = insts[i]
+        i += 1
+        body = bodies.get(inst.arg1) if inst.cmd == 'call' else None
+        # a local of the caller would hide a global of the callee
+        if body is None or get_free_names(body) & local_names:
+            result.append(inst)
+            continue
+        code, renamed = expand_call(inst.arg1, body, names, labels)
+        result += code
+        after = insts[i] if i < len(insts) else None
+        if (
+                after and after.cmd == 'mov' and is_ident(after.arg2)
+                and after.arg2.ident == GETVAL and RETVAL in renamed
+        ):
+            result.append(Instruction('mov', after.arg1, Argument(
+                'ident', after.arg2.data_type, renamed[RETVAL]
+            )))
+            i += 1
+    return result
+
+
+def get_recursive(calls):
+    # procedures that may call themselves
+    recursive = set()
+    for name in calls:
+        reached = set()
+        todo = list(calls[name])
+        while todo:
+            callee = todo.pop()
+            if callee not in reached:
+                reached.add(callee)
+                todo += calls.get(callee, [])
+        if name in reached:
+            recursive.add(name)
+    return recursive
+
+
+def inline(segments, max_size=INLINE_SIZE):
+    # substitutes procedures of at most max_size instructions that do
+    # not call themselves at their calls, procedures can only call the
+    # ones defined before them so the callees are done first
+    code = [inst for name, insts in segments for inst in insts]
+    names = get_names(code)
+    labels = {inst.arg1 for inst in code if inst.cmd == 'label'}
+    calls = {
+        name: {inst.arg1 for inst in insts if inst.cmd in CALLS}
+        for name, insts in segments if name is not None
+    }
+    recursive = get_recursive(calls)
+    bodies = {}
+    result = []
+    for name, insts in segments:
+        if name is not None:
+            insts = inline_calls(insts, bodies, names, labels)
+            body = insts[1:-1]
+            if (
+                    name not in recursive and len(body) <= max_size
+                    and all(inst.cmd not in ['exit', 'tailcall'] for inst in body)
+            ):
+                bodies[name] = body
+        result.append((name, insts))
+    return result
+
+
+class Window:
+    # the instructions of a procedure as a peephole rule sees them at i
+    def __init__(self, insts, local_names):
+        self.insts = insts
+        self.local_names = local_names
+        self.live_after = get_live_after(insts)
+        self.targets = {get_target(inst) for inst in insts if inst.cmd in JUMPS}
+        self.aliases = {} # merged label -> kept label
+        self.i = 0
+
+    def get(self, offset):
+        j = self.i + offset
+        if j < len(self.insts):
+            return self.insts[j]
+        return Instruction('end')
+
+    def is_dead(self, ident, offset):
+        return ident not in self.live_after[self.i+offset]
+
+    def is_local(self, arg):
+        return is_temp(arg) or is_ident(arg) and arg.ident in self.local_names
+
+
+# peephole rules return (instructions consumed, replacement) or None
+
+
+def goto_next(window):
+    # goto L; label L
+    inst = window.get(0)
+    if inst.cmd != 'goto':
+        return None
+    offset = 1
+    while window.get(offset).cmd == 'label':
+        if window.get(offset).arg1 == inst.arg1:
+            return 1, []
+        offset += 1
+    return None
+
+
+def unused_label(window):
+    # a label no jump refers to, like the exit of an inlined procedure
+    inst = window.get(0)
+    if inst.cmd == 'label' and inst.arg1 not in window.targets:
+        return 1, []
+    return None
+
+
+def merge_labels(window):
+    # label L0; label L1, jumps to L1 go to L0
+    first = window.get(0)
+    second = window.get(1)
+    if first.cmd == 'label' and second.cmd == 'label':
+        window.aliases[second.arg1] = first.arg1
+        return 2, [first]
+    return None
+
+
+def unreachable(window):
+    # ret; ret, or anything else behind a jump up to the next label
+    first = window.get(0)
+    second = window.get(1)
+    if (
+            first.cmd in LEAVES
+            and second.cmd not in ['label', 'end']
+    ):
+        return 2, [first]
+    return None
+
+
+def mov_copy(window):
+    # mov _t0 _getval; mov x _t0 -> mov x _getval
+    first = window.get(0)
+    second = window.get(1)
+    if (
+            first.cmd == 'mov' and second.cmd == 'mov'
+            and is_temp(first.arg1) and is_ident(second.arg2)
+            and second.arg2.ident == first.arg1.ident
+            and second.arg2.data_type == first.arg2.data_type
+            and window.is_dead(first.arg1.ident, 1)
+    ):
+        return 2, [Instruction('mov', second.arg1, first.arg2)]
+    return None
+
+
+def calc_target(window):
+    # plus _t0 y i; mov y _t0 -> plus y y i, the machine stores the raw
+    # result either way and every use converts it by the same type;
+    # globals are left alone as only mov checks that they exist
+    first = window.get(0)
+    second = window.get(1)
+    if (
+            first.cmd in CALCULATION and second.cmd == 'mov'
+            and is_temp(first.arg1) and is_ident(second.arg2)
+            and second.arg2.ident == first.arg1.ident
+            and window.is_local(second.arg1)
+            and first.arg1.data_type == second.arg2.data_type
+            and second.arg1.data_type == second.arg2.data_type
+            and window.is_dead(first.arg1.ident, 1)
+    ):
+        return 2, [
+            Instruction(first.cmd, second.arg1, first.arg2, first.arg3)
+        ]
+    return None
+
+
+PEEPHOLE_RULES = [
+    goto_next, unused_label, merge_labels, unreachable, mov_copy, calc_target
+]
+
+
+def rename_labels(insts, aliases):
+    for inst in insts:
+        if inst.cmd in JUMPS:
+            label = get_target(inst)
+            while label in aliases:
+                label = aliases[label]
+            set_target(inst, label)
+    return insts
+
+
+def peephole_proc(insts, local_names, rules, removed):
+    changed = True
+    while changed:
+        changed = False
+        window = Window(insts, local_names)
+        result = []
+        while window.i < len(insts):
+            match = None
+            for rule in rules:
+                match = rule(window)
+                if match:
+                    break
+            if match:
+                consumed, replacement = match
+                result += replacement
+                removed[rule.__name__] = (
+                    removed.get(rule.__name__, 0) + consumed - len(replacement)
+                )
+                window.i += consumed
+                changed = True
+            else:
+                result.append(insts[window.i])
+                window.i += 1
+        insts = rename_labels(result, window.aliases)
+    return insts
+
+
+def peephole(code, rules=PEEPHOLE_RULES):
+    # returns the code and the number of instructions each rule removed
+    removed = {rule.__name__: 0 for rule in rules}
+    result = []
+    for name, insts in split_procs(code):
+        if name is None:
+            result += insts
+        else:
+            local_names = {
+                inst.arg2 for inst in insts if inst.cmd == 'alloc'
+            }
+            result += peephole_proc(insts, local_names, rules, removed)
+    return result, removed
+
+
+def get_live_in(block, live_out):
+    live = set(live_out)
+    for inst in reversed(block):
+        if inst.cmd in DEFINES and is_temp(inst.arg1):
+            live.discard(inst.arg1.ident)
+        for arg in get_uses(inst):
+            if is_temp(arg):
+                live.add(arg.ident)
+    return live
+
+
+def get_dominators(successors):
+    # immediate dominators of the blocks reached from the first one, by
+    # iterating over them in reverse postorder (Cooper, Harvey, Kennedy);
+    # returns them with the predecessors and the order of the blocks
+    order = []
+    seen = {0}
+    stack = [(0, iter(successors[0]))]
+    while stack:
+        block, children = stack[-1]
+        for child in children:
+            if child not in seen:
+                seen.add(child)
+                stack.append((child, iter(successors[child])))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    position = {block: i for i, block in enumerate(order)}
+    predecessors = [[] for block in successors]
+    for block in order:
+        for successor in successors[block]:
+            predecessors[successor].append(block)
+    dominators = {0: 0}
+    def intersect(a, b):
+        while a != b:
+            while position[a] > position[b]:
+                a = dominators[a]
+            while position[b] > position[a]:
+                b = dominators[b]
+        return a
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            dominator = None
+            for predecessor in predecessors[block]:
+                if predecessor in dominators:
+                    dominator = (
+                        predecessor if dominator is None
+                        else intersect(predecessor, dominator)
+                    )
+            if dominators.get(block) != dominator:
+                dominators[block] = dominator
+                changed = True
+    return dominators, predecessors, position
+
+
+def dominates(dominators, a, b):
+    while b != a:
+        if b == 0:
+            return False
+        b = dominators[b]
+    return True
+
+
+def get_loops(successors):
+    # natural loops as [(header, blocks)], inner loops first: a jump
+    # back to a block dominating its source closes a loop of the blocks
+    # reaching the source without passing the header
+    dominators, predecessors, position = get_dominators(successors)
+    loops = {}
+    for source in dominators:
+        for header in successors[source]:
+            if (
+                    position[header] <= position[source]
+                    and dominates(dominators, header, source)
+            ):
+                body = loops.setdefault(header, {header})
+                todo = [source]
+                while todo:
+                    block = todo.pop()
+                    if block not in body:
+                        body.add(block)
+                        todo += predecessors[block]
+    return sorted(loops.items(), key=lambda loop: len(loop[1])), predecessors
+
+
+def has_preheader(blocks, header, body, predecessors):
+    # code in front of the header label runs once before the loop if
+    # the block above falls into it and nothing else enters it
+    entries = [block for block in predecessors[header] if block not in body]
+    if entries != [header-1] or not blocks[header-1]:
+        return False
+    last = blocks[header-1][-1]
+    return not (last.cmd in JUMPS and get_target(last) == blocks[header][0].arg1)
+
+
+def get_region(blocks, preheaders, header, body):
+    # the instruction lists of a loop in code order, the preheaders of
+    # inner loops included
+    region = []
+    for block in sorted(body):
+        if block != header and block in preheaders:
+            region.append(preheaders[block])
+        region.append(blocks[block])
+    return region
+
+
+def is_invariant(inst, defined, live, local_names):
+    # a calculation into a temp written nowhere else in the loop, whose
+    # operands do not change in it; a division that may fail stays
+    if inst.cmd not in CALCULATION or not is_temp(inst.arg1):
+        return False
+    if defined[inst.arg1.ident] != 1 or inst.arg1.ident in live:
+        return False
+    if may_fail(inst):
+        return False
+    for arg in [inst.arg2, inst.arg3]:
+        if arg is None or arg.arg_type == 'data':
+            continue
+        if not (is_temp(arg) or arg.ident in local_names):
+            return False
+        if defined.get(arg.ident, 0):
+            return False
+    return True
+
+
+def hoist_invariants(region, live, local_names):
+    # removes the invariant calculations from the loop and returns them
+    # in order with the number of writes of each name left in the loop;
+    # live holds the temps read before their write in the loop or after
+    # it, those must keep their values
+    defined = {}
+    for insts in region:
+        for inst in insts:
+            name = get_defined(inst)
+            if name is not None:
+                defined[name] = defined.get(name, 0) + 1
+    hoisted = []
+    changed = True
+    while changed:
+        changed = False
+        for insts in region:
+            kept = []
+            for inst in insts:
+                if is_invariant(inst, defined, live, local_names):
+                    hoisted.append(inst)
+                    defined[inst.arg1.ident] = 0
+                    changed = True
+                else:
+                    kept.append(inst)
+            insts[:] = kept
+    return hoisted, defined
+
+
+def get_exit_test(blocks, header, body):
+    # the test leaving the loop at the end of its header as (test,
+    # relation, variable, bound), the loop goes on while the relation
+    # holds: a branch, or a relation into a temp and goto_if_false
+    branch = blocks[header][-1]
+    if branch.cmd not in JUMPS or any(
+            blocks[block][0].cmd == 'label'
+            and blocks[block][0].arg1 == get_target(branch)
+            for block in body if blocks[block]
+    ):
+        return None
+    if branch.cmd in BRANCH:
+        return branch, NEGATED[BRANCH[branch.cmd]], branch.arg1, branch.arg2
+    if branch.cmd != 'goto_if_false' or len(blocks[header]) < 3:
+        return None
+    test = blocks[header][-2]
+    if (
+            test.cmd not in CALCULATION or not is_temp(test.arg1)
+            or not is_ident(branch.arg1)
+            or branch.arg1.ident != test.arg1.ident
+    ):
+        return None
+    return test, test.cmd, test.arg2, test.arg3
+
+
+def get_induction(blocks, header, body, loops, defined, local_names,
+                  exit_test):
+    # the basic induction variable the header tests as {name: (update,
+    # step, first, lowest, highest)}: a local of type int changed only
+    # by adding a constant, once an iteration; its bounds come from its
+    # constant value before the loop and the test leaving the loop
+    if exit_test is None:
+        return {}
+    test, relation, variable, bound = exit_test
+    if (
+            relation not in ['lt', 'le', 'gt', 'ge']
+            or not is_ident(variable) or bound.arg_type != 'data'
+            or variable.data_type != 'int' or bound.data_type != 'int'
+    ):
+        return {}
+    name = variable.ident
+    if name not in local_names or defined.get(name) != 1:
+        return {}
+    inner = set()
+    for other, other_body in loops:
+        if other != header and other in body:
+            inner |= other_body
+    update = None
+    for block in body - inner:
+        for inst in blocks[block]:
+            if (
+                    inst.cmd in ['plus', 'minus'] and inst.arg1.ident == name
+                    and is_ident(inst.arg2) and inst.arg2.ident == name
+                    and inst.arg3.arg_type == 'data'
+                    and inst.arg1.data_type == inst.arg2.data_type == 'int'
+                    and inst.arg3.data_type == 'int'
+            ):
+                update = inst
+    if update is None:
+        return {}
+    step = update.arg3.val({})
+    if update.cmd == 'minus':
+        step = -step
+    if step == 0 or (step > 0) != (relation in ['lt', 'le']):
+        return {}
+    first = None
+    for inst in blocks[header-1]:
+        if get_defined(inst) == name:
+            first = None
+            if inst.cmd == 'mov' and inst.arg2.arg_type == 'data':
+                first = inst.arg2.val({})
+            elif inst.cmd == 'alloc' and inst.arg1 == 'int':
+                first = inst.arg3.val({})
+    if first is None:
+        return {}
+    bound = bound.val({})
+    values = [first, bound, bound + step]
+    return {name: (update, step, first, min(values), max(values))}
+
+
+def reduce_strength(blocks, region, body, induction, preheader, names, reads):
+    # mul _t0 i c -> mov _t0 k, k starts at i*c and adds c*step behind
+    # the update of i; only done when no value leaves the 32 bits the
+    # machine keeps, so the sums stay equal to the products
+    reduced = {}
+    copies = []
+    for insts in region:
+        for offset, inst in enumerate(insts):
+            if inst.cmd != 'mul' or not is_temp(inst.arg1):
+                continue
+            args = [inst.arg2, inst.arg3]
+            if is_ident(inst.arg3) and inst.arg3.ident in induction:
+                args.reverse()
+            variable, factor = args
+            if not (
+                    is_ident(variable) and variable.ident in induction
+                    and factor.arg_type == 'data'
+                    and inst.arg1.data_type == variable.data_type == 'int'
+                    and factor.data_type == 'int'
+            ):
+                continue
+            update, step, first, lowest, highest = induction[variable.ident]
+            factor = factor.val({})
+            if max(-lowest, highest, abs(step)) * abs(factor) >= 2**31:
+                continue
+            key = (variable.ident, factor)
+            if key not in reduced:
+                reduced[key] = get_fresh(TEMP_PREFIX + 'iv', names)
+                preheader.append(Instruction(
+                    'mov', Argument('ident', 'int', reduced[key]),
+                    Argument('data', 'int', first * factor)
+                ))
+            insts[offset] = Instruction(
+                'mov', inst.arg1, Argument('ident', 'int', reduced[key])
+            )
+            reads[variable.ident] -= 1
+            copies.append((insts, insts[offset]))
+    for (name, factor), temp in reduced.items():
+        update, step = induction[name][:2]
+        for block in body:
+            if update in blocks[block]:
+                blocks[block].insert(
+                    blocks[block].index(update) + 1,
+                    Instruction(
+                        'plus', Argument('ident', 'int', temp),
+                        Argument('ident', 'int', temp),
+                        Argument('data', 'int', factor * step)
+                    )
+                )
+    for insts, inst in copies:
+        forward_copy(insts, insts.index(inst))
+    return reduced
+
+
+def forward_copy(insts, offset):
+    # mov _t0 _t1 at offset, the following reads of _t0 read _t1 until
+    # either of them is written again
+    inst = insts[offset]
+    target = inst.arg1.ident
+    source = inst.arg2.ident
+    for inst in insts[offset+1:]:
+        for slot in USES.get(inst.cmd, []):
+            arg = getattr(inst, slot)
+            if is_ident(arg) and arg.ident == target:
+                setattr(inst, slot, Argument('ident', arg.data_type, source))
+        if get_defined(inst) in [target, source]:
+            break
+
+
+def replace_test(lists, exit_test, induction, reduced, local_names, reads):
+    # lt _t0 i n -> lt _t0 k n*c for k = i*c with c > 0 when the update
+    # is the only other read of i, its writes are dead then; a mov from
+    # a global is kept as the machine checks that the global exists
+    test, relation, variable, bound = exit_test
+    name = variable.ident
+    factors = [factor for other, factor in reduced if other == name and factor > 0]
+    if not factors or reads[name] != 2:
+        return
+    reads[name] = 0
+    factor = factors[0]
+    operands = [
+        Argument('ident', 'int', reduced[(name, factor)]),
+        Argument('data', 'int', bound.val({}) * factor)
+    ]
+    if test.cmd in BRANCH:
+        replacement = Instruction(test.cmd, *operands, test.arg3)
+    else:
+        replacement = Instruction(test.cmd, test.arg1, *operands)
+    def is_dead(inst):
+        return (
+            get_defined(inst) == name
+            and inst.cmd in ['mov', *CALCULATION] and inst.cmd != 'div'
+            and all(
+                is_temp(arg) or arg.ident in local_names
+                or arg.ident.startswith(ARG_PREFIX)
+                for arg in get_uses(inst)
+            )
+        )
+    for insts in lists:
+        insts[:] = [
+            replacement if inst is test else inst
+            for inst in insts if not is_dead(inst)
+        ]
+
+
+def optimize_loops(insts):
+    # moves the invariant calculations of each loop in front of it and
+    # turns multiplications by its induction variables into additions,
+    # inner loops first; the passes only take calculations out of blocks
+    # or put others in, so the blocks and the liveness found before stay
+    # valid, the liveness keeps more temps than it has to at most
+    local_names = {inst.arg2 for inst in insts if inst.cmd == 'alloc'}
+    rename_webs(insts)
+    blocks = get_blocks(insts)
+    successors = get_successors(blocks)
+    loops, predecessors = get_loops(successors)
+    if not loops:
+        return insts
+    names = get_names(insts)
+    reads = {}
+    for inst in insts:
+        for arg in get_uses(inst):
+            reads[arg.ident] = reads.get(arg.ident, 0) + 1
+    live_in = [
+        get_live_in(block, live_out) for block, live_out
+        in zip(blocks, get_live_out(blocks, successors))
+    ]
+    preheaders = {}
+    for header, body in loops:
+        if (
+                blocks[header][0].cmd != 'label'
+                or not has_preheader(blocks, header, body, predecessors)
+        ):
+            continue
+        live = set(live_in[header])
+        for block in body:
+            for successor in successors[block]:
+                if successor not in body:
+                    live |= live_in[successor]
+        region = get_region(blocks, preheaders, header, body)
+        preheader, defined = hoist_invariants(region, live, local_names)
+        exit_test = get_exit_test(blocks, header, body)
+        induction = get_induction(
+            blocks, header, body, loops, defined, local_names, exit_test
+        )
+        reduced = reduce_strength(
+            blocks, region, body, induction, preheader, names, reads
+        )
+        if reduced:
+            replace_test(
+                [*blocks, *preheaders.values()], exit_test,
+                induction, reduced, local_names, reads
+            )
+        preheaders[header] = preheader
+    result = []
+    for i, block in enumerate(blocks):
+        result += preheaders.get(i, [])
+        result += block
+    blocks = get_blocks(result)
+    remove_dead_temps(blocks)
+    return [inst for block in blocks for inst in block]
+
+
+def get_tail_call(insts, i, return_type):
+    # the number of instructions of a call at i whose value is returned
+    # right away, 0 if it is not a tail call
+    following = insts[i+1:i+4]
+    def is_getval(inst):
+        return (
+            inst.cmd == 'mov' and is_ident(inst.arg2)
+            and inst.arg2.ident == GETVAL
+            and inst.arg1.data_type == inst.arg2.data_type == return_type
+        )
+    def is_retval(inst):
+        return (
+            inst.cmd == 'mov' and inst.arg1.ident == RETVAL
+            and inst.arg1.data_type == inst.arg2.data_type == return_type
+        )
+    cmds = [inst.cmd for inst in following]
+    if return_type is None:
+        # call P; ret
+        return 2 if cmds[:1] == ['ret'] else 0
+    if cmds[:2] == ['mov', 'ret'] and is_getval(following[0]):
+        # call P; mov _retval _getval; ret
+        return 3 if is_retval(following[0]) else 0
+    if (
+            cmds == ['mov', 'mov', 'ret'] and is_getval(following[0])
+            and is_temp(following[0].arg1) and is_retval(following[1])
+            and is_temp(following[1].arg2)
+            and following[1].arg2.ident == following[0].arg1.ident
+    ):
+        # call P; mov _t0 _getval; mov _retval _t0; ret
+        return 4
+    return 0
+
+
+def eliminate_tail_calls(insts, labels):
+    # a tail call reuses the frame, the value of the callee is passed to
+    # the caller by its ret; a tail call of the procedure itself jumps
+    # back to the entry, which allocates its locals again
+    name = insts[0].arg1
+    return_type = None
+    for inst in insts:
+        if inst.cmd == 'alloc' and inst.arg2 == RETVAL:
+            return_type = inst.arg1
+    entry = None
+    result = []
+    i = 0
+    while i < len(insts):
+        inst = insts[i]
+        length = 0
+        if inst.cmd == 'call':
+            length = get_tail_call(insts, i, return_type)
+        if not length:
+            result.append(inst)
+            i += 1
+            continue
+        if inst.arg1 == name:
+            if entry is None:
+                entry = get_fresh('%s_entry' % name, labels)
+            result.append(Instruction('goto', entry))
+        else:
+            result.append(Instruction('tailcall', inst.arg1))
+        i += length
+    if entry is not None:
+        result.insert(1, Instruction('label', entry))
+    return result
+
+
+def get_webs(insts):
+    # def-use webs of the temps, like the versions of SSA form: a temp
+    # written and read within a block gets a web of its own each time,
+    # the writes whose value leaves their block and the reads of values
+    # from other blocks share one web per temp, as a phi function would
+    # join them; returns {(index, slot): web}
+    blocks = get_blocks(insts)
+    live_out = get_live_out(blocks, get_successors(blocks))
+    webs = {}
+    index = 0
+    for block, live in zip(blocks, live_out):
+        last = {}
+        for offset, inst in enumerate(block):
+            if inst.cmd in DEFINES and is_temp(inst.arg1):
+                last[inst.arg1.ident] = offset
+        current = {}
+        for offset, inst in enumerate(block):
+            for slot in USES.get(inst.cmd, []):
+                arg = getattr(inst, slot)
+                if is_temp(arg):
+                    webs[(index, slot)] = current.get(arg.ident, arg.ident)
+            if inst.cmd in DEFINES and is_temp(inst.arg1):
+                temp = inst.arg1.ident
+                if last[temp] == offset and temp in live:
+                    current[temp] = temp
+                else:
+                    current[temp] = index
+                webs[(index, 'arg1')] = current[temp]
+            index += 1
+    return webs
+
+
+def rename_webs(insts):
+    # gives each web a temp of its own, returns {web: temp}
+    webs = get_webs(insts)
+    names = {}
+    for position in sorted(webs):
+        names.setdefault(webs[position], '%sw%d' % (TEMP_PREFIX, len(names)))
+    for (index, slot), web in webs.items():
+        arg = getattr(insts[index], slot)
+        setattr(insts[index], slot, Argument('ident', arg.data_type, names[web]))
+    return names
+
+
+def allocate_temps(insts):
+    # renames the temps of a procedure to as few as the interference of
+    # their webs allows, a copy between temps takes the color of its
+    # source if it can and disappears
+    names = rename_webs(insts)
+    live_after = get_live_after(insts)
+    neighbors = {name: set() for name in names.values()}
+    preferred = {}
+    use_types = {}
+    for index, inst in enumerate(insts):
+        for arg in get_uses(inst):
+            if is_temp(arg):
+                use_types.setdefault(arg.ident, set()).add(arg.data_type)
+        if inst.cmd in DEFINES and is_temp(inst.arg1):
+            target = inst.arg1.ident
+            for name in live_after[index]:
+                if name != target:
+                    neighbors[target].add(name)
+                    neighbors[name].add(target)
+            if inst.cmd == 'mov' and is_temp(inst.arg2):
+                preferred[target] = inst.arg2.ident
+    colors = {}
+    for name in names.values():
+        used = {colors[other] for other in neighbors[name] if other in colors}
+        color = colors.get(preferred.get(name))
+        if color is None or color in used:
+            color = 0
+            while color in used:
+                color += 1
+        colors[name] = color
+    result = []
+    for inst in insts:
+        # the copy only converted the value if the uses read it by
+        # another type
+        copy = (
+            inst.cmd == 'mov' and is_temp(inst.arg1) and is_temp(inst.arg2)
+            and colors[inst.arg1.ident] == colors[inst.arg2.ident]
+            and use_types.get(inst.arg1.ident, set()) <= {inst.arg2.data_type}
+        )
+        for slot in ['arg1', 'arg2', 'arg3']:
+            arg = getattr(inst, slot)
+            if is_temp(arg):
+                arg.ident = TEMP_PREFIX + str(colors[arg.ident])
+        if copy:
+            continue
+        result.append(inst)
+    return result
+
+
+def optimize(code, removed=None, inline_size=INLINE_SIZE):
+    # removed collects the counts of the peephole rules
+    segments = [
+        (name, insts if name is None else optimize_proc(insts))
+        for name, insts in remove_uncalled(split_procs(code))
+    ]
+    result = []
+    for name, insts in remove_uncalled(inline(segments, inline_size)):
+        if name is None:
+            result += insts
+        else:
+            result += optimize_proc(insts)
+    result, counts = peephole(result)
+    if removed is not None:
+        for rule, count in counts.items():
+            removed[rule] = removed.get(rule, 0) + count
+    labels = {inst.arg1 for inst in result if inst.cmd == 'label'}
+    code = []
+    for name, insts in split_procs(result):
+        if name is None:
+            code += insts
+        else:
+            code += allocate_temps(
+                eliminate_tail_calls(optimize_loops(insts), labels)
+            )
+    return code
+
+
+def main():
+    from translator import compile_file, print_code
+    removed = {}
+    first = True
+    for file_name in sys.argv:
+        if not first:
+            print_code(optimize(compile_file(file_name), removed))
+        first = False
+    for rule, count in removed.items():
+        print('%s: %d removed' % (rule, count), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
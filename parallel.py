@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import copy
+from itertools import takewhile
+from concurrent.futures import ProcessPoolExecutor
+from machine import Instruction, Argument
+from scanner import Token, PositionIndex, map_file, get_spans, scan
+from syntax import SyntaxTreeNode, build_syntax_tree
+from definition import Scope
+from translator import (
+    LABEL_PREFIX, MAIN, get_code_generator, compile_file, print_code
+)
+
+
+# functions per task for each worker, fewer tasks pickle fewer signatures
+TASKS_PER_WORKER = 4
+
+
+class Chunk:
+    # the declarations before the first function, or a Function
+    start = 0 # offset of the first token
+    end = 0 # offset behind the last token
+    tokens = None # list of Token, only kept for the declarations
+    name = None
+    parameters = None # tuple of parameter types
+    return_type = None # None if it has to be detected from the body
+
+    def __init__(self, start):
+        self.start = start
+        self.tokens = []
+
+
+def split_file(file_name):
+    # a function starts at each def outside of braces, its header is
+    # read for the signature: def ident ( Type ident, ... ) -> Type {
+    code = map_file(file_name)
+    positions = PositionIndex(code, b'\n')
+    decls = Chunk(0)
+    functions = []
+    depth = 0
+    header = None
+    end = 0
+    for token_type, pos, end in get_spans(code, positions, True, 'regex'):
+        if token_type == 'op':
+            string = code[pos:end]
+            if string == b'{':
+                if depth == 0 and header is not None:
+                    set_signature(functions[-1], header)
+                    header = None
+                depth += 1
+            elif string == b'}':
+                depth -= 1
+        elif (
+                depth == 0 and token_type == 'ident'
+                and code[pos:end] == b'def'
+        ):
+            functions.append(Chunk(pos))
+            header = []
+        if header is not None:
+            header.append(
+                Token(token_type, code[pos:end].decode(), pos, positions)
+            )
+        elif not functions:
+            decls.tokens.append(
+                Token(token_type, code[pos:end].decode(), pos, positions)
+            )
+    chunks = [decls, *functions]
+    for chunk, next_chunk in zip(chunks, chunks[1:]):
+        chunk.end = next_chunk.start
+    chunks[-1].end = end
+    return decls, functions
+
+
+def set_signature(function, header):
+    strings = [token.string for token in header]
+    if len(strings) > 1:
+        function.name = strings[1]
+    function.parameters = tuple(
+        token.string for token in header if token.token_type == 'type_key'
+    )
+    if '->' in strings:
+        arrow = strings.index('->')
+        function.parameters = function.parameters[:-1]
+        if arrow+1 < len(strings):
+            function.return_type = strings[arrow+1]
+
+
+def encode_code(code):
+    # instructions as plain tuples, which are much cheaper to pickle
+    rows = []
+    for inst in code:
+        row = [inst.cmd]
+        for arg in [inst.arg1, inst.arg2, inst.arg3]:
+            if isinstance(arg, Argument):
+                arg = (arg.arg_type, arg.data_type, arg.data, arg.ident)
+            row.append(arg)
+        rows.append(tuple(row))
+    return rows
+
+
+def decode_code(rows):
+    code = []
+    for cmd, *args in rows:
+        for i, arg in enumerate(args):
+            if isinstance(arg, tuple):
+                arg_type, data_type, data, ident = arg
+                args[i] = Argument(
+                    arg_type, data_type, data if arg_type == 'data' else ident
+                )
+        code.append(Instruction(cmd, *args))
+    return code
+
+
+def compile_functions(file_name, start, end, symbols, index, engine):
+    # parse the functions in [start, end) of the file against symbols and
+    # translate them with labels prefixed by their index in the program
+    code = map_file(file_name)
+    positions = PositionIndex(code, b'\n')
+    tokens = takewhile(
+        lambda token: token.pos < end,
+        scan(code, get_spans(code, positions, True, 'regex', start), positions)
+    )
+    codes = []
+    def on_function(node):
+        synthesis_code = get_code_generator(
+            '%s%d_' % (LABEL_PREFIX, index+len(codes))
+        )
+        codes.append(encode_code(synthesis_code(node)))
+        return SyntaxTreeNode('Translated')
+    try:
+        build_syntax_tree(tokens, engine, on_function, 'Functions', symbols)
+    except Exception:
+        # the sequential compile reports the error
+        return None
+    return codes
+
+
+def get_batches(functions, workers):
+    # runs of functions with declared return types go to the pool in
+    # batches, the others are compiled in order to detect their type
+    size = max(1, len(functions) // (workers * TASKS_PER_WORKER))
+    batches = []
+    for index, function in enumerate(functions):
+        inline = function.return_type is None
+        if (
+                batches and not inline and not batches[-1][0]
+                and len(batches[-1][1]) < size
+        ):
+            batches[-1][1].append(index)
+        else:
+            batches.append((inline, [index]))
+    return batches
+
+
+def compile_file_parallel(file_name, workers=None, engine='table'):
+    workers = workers or os.cpu_count() or 1
+    try:
+        decls, functions = split_file(file_name)
+    except Exception:
+        return compile_file(file_name, engine)
+    if not functions:
+        return compile_file(file_name, engine)
+    symbols = Scope()
+    synthesis_code = get_code_generator()
+    try:
+        decls_root = build_syntax_tree(
+            iter(decls.tokens), engine, start='Decls', symbols=symbols
+        )
+    except Exception:
+        return compile_file(file_name, engine)
+    decls_code = synthesis_code(decls_root)
+    results = []
+    failed = False
+    with ProcessPoolExecutor(workers) as executor:
+        for inline, indexes in get_batches(functions, workers):
+            first = functions[indexes[0]]
+            last = functions[indexes[-1]]
+            if inline:
+                codes = compile_functions(
+                    file_name, first.start, last.end, symbols,
+                    indexes[0], engine
+                )
+                if codes is None:
+                    failed = True
+                    break
+                results.append(codes)
+                continue
+            # a snapshot, inline functions keep adding to symbols
+            results.append(executor.submit(
+                compile_functions, file_name, first.start, last.end,
+                copy.deepcopy(symbols), indexes[0], engine
+            ))
+            for index in indexes:
+                function = functions[index]
+                if function.name not in symbols.functions:
+                    symbols.functions[function.name] = {
+                        'parameters': function.parameters,
+                        'return_type': function.return_type
+                    }
+        code = [*decls_code]
+        for result in results:
+            if failed:
+                break
+            codes = result if isinstance(result, list) else result.result()
+            if codes is None:
+                failed = True
+                break
+            for function_code in codes:
+                code += decode_code(function_code)
+        if failed:
+            executor.shutdown(cancel_futures=True)
+    if failed:
+        return compile_file(file_name, engine)
+    return [*code, Instruction('start'), Instruction('call', MAIN)]
+
+
+def main():
+    workers = None
+    file_names = sys.argv[1:]
+    if file_names[:1] == ['-j'] and len(file_names) > 1:
+        workers = int(file_names[1])
+        file_names = file_names[2:]
+    for file_name in file_names:
+        print_code(compile_file_parallel(file_name, workers))
+
+
+if __name__ == '__main__':
+    main()
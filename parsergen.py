@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+from definition import TOKEN, SYNTAX
+from grammar import ParseTable, get_grammar_hash, EMPTY, ERROR
+from scanner import get_tokens
+
+
+START = 'Program'
+# end of input in FOLLOW sets
+END = '$'
+OUTPUT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'syntax_parser.py'
+)
+
+
+class GrammarError(Exception):
+    def __init__(self, msgs):
+        self.msgs = msgs
+
+    def __str__(self):
+        return 'Grammar Error:\n\t%s' % '\n\t'.join(self.msgs)
+
+
+def get_nullable(syntax):
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for non_terminal, rule in syntax.items():
+            if non_terminal in nullable:
+                continue
+            if rule['empty'] or any(
+                    all(item in nullable for item in deriv_tuple)
+                    for first, deriv_tuple in rule['derivations']
+            ):
+                nullable.add(non_terminal)
+                changed = True
+    return nullable
+
+
+def get_sequence_first(sequence, first, nullable):
+    # FIRST of a symbol sequence and whether all of it can vanish
+    result = set()
+    for item in sequence:
+        if item in first:
+            result |= first[item]
+            if item not in nullable:
+                return result, False
+        else:
+            result.add(item)
+            return result, False
+    return result, True
+
+
+def get_first(syntax, nullable):
+    first = {non_terminal: set() for non_terminal in syntax}
+    changed = True
+    while changed:
+        changed = False
+        for non_terminal, rule in syntax.items():
+            for key, deriv_tuple in rule['derivations']:
+                items, _ = get_sequence_first(deriv_tuple, first, nullable)
+                if not items <= first[non_terminal]:
+                    first[non_terminal] |= items
+                    changed = True
+    return first
+
+
+def get_follow(syntax, first, nullable, start=START):
+    follow = {non_terminal: set() for non_terminal in syntax}
+    follow[start].add(END)
+    changed = True
+    while changed:
+        changed = False
+        for non_terminal, rule in syntax.items():
+            for key, deriv_tuple in rule['derivations']:
+                for i, item in enumerate(deriv_tuple):
+                    if item not in syntax:
+                        continue
+                    items, vanish = get_sequence_first(
+                        deriv_tuple[i+1:], first, nullable
+                    )
+                    if vanish:
+                        items = items | follow[non_terminal]
+                    if not items <= follow[item]:
+                        follow[item] |= items
+                        changed = True
+    return follow
+
+
+def get_lexed_type(string):
+    tokens = list(get_tokens(string))
+    if len(tokens) == 1 and tokens[0].string == string:
+        return tokens[0].token_type
+    return None
+
+
+class ParserGenerator:
+    # checks the hand-written first keys of SYNTAX against computed
+    # FIRST / FOLLOW sets and writes the parse table out as one
+    # predict function per non-terminal
+    def __init__(self, syntax=SYNTAX, token_list=TOKEN):
+        self.syntax = syntax
+        self.token_list = token_list
+        self.table = ParseTable(syntax, token_list)
+        self.nullable = get_nullable(syntax)
+        self.first = get_first(syntax, self.nullable)
+        self.follow = get_follow(syntax, self.first, self.nullable)
+        # (token_type, keyword) pairs the scanner can actually produce
+        self.terminals = [
+            (token_type, keyword)
+            for token_type, keyword in self.table.terminals
+            if keyword is None or get_lexed_type(keyword) == token_type
+        ]
+
+    def starts(self, symbols, terminal):
+        return any(
+            self.table.matches(symbol, terminal)
+            for symbol in symbols if symbol != END
+        )
+
+    def get_options(self, non_terminal, terminal):
+        # derivations the terminal can start according to FIRST / FOLLOW
+        rule = self.syntax[non_terminal]
+        options = []
+        for key, deriv_tuple in rule['derivations']:
+            items, vanish = get_sequence_first(
+                deriv_tuple, self.first, self.nullable
+            )
+            if vanish:
+                items = items | self.follow[non_terminal]
+            if self.starts(items, terminal) and deriv_tuple not in options:
+                options.append(deriv_tuple)
+        if rule['empty'] and self.starts(self.follow[non_terminal], terminal):
+            options.append(())
+        return options
+
+    def get_explicit(self, non_terminal, terminal):
+        # derivations selected by a first key other than ANY
+        rule = self.syntax[non_terminal]
+        explicit = []
+        if rule.get('follow') and self.table.matches(rule['follow'], terminal):
+            explicit.append(())
+        for key, deriv_tuple in rule['derivations']:
+            if key == 'ANY' or not self.table.matches(key, terminal):
+                continue
+            if deriv_tuple not in explicit:
+                explicit.append(deriv_tuple)
+        return explicit
+
+    def check(self):
+        errors = []
+        for non_terminal, rule in self.syntax.items():
+            follow_key = rule.get('follow')
+            if follow_key and not rule['empty']:
+                errors.append('%s: Follow key without empty' % non_terminal)
+            if follow_key and not any(
+                    self.table.matches(follow_key, terminal)
+                    and self.starts(self.follow[non_terminal], terminal)
+                    for terminal in self.terminals
+            ):
+                errors.append(
+                    '%s: %s not in FOLLOW' % (non_terminal, follow_key)
+                )
+            for key, deriv_tuple in rule['derivations']:
+                if key == 'ANY':
+                    continue
+                if not any(
+                        self.table.matches(key, terminal)
+                        and deriv_tuple in self.get_options(
+                            non_terminal, terminal
+                        )
+                        for terminal in self.terminals
+                ):
+                    errors.append(
+                        '%s: %s never starts %s'
+                        % (non_terminal, key, ' '.join(deriv_tuple))
+                    )
+            keyed = [
+                deriv_tuple for key, deriv_tuple in rule['derivations']
+                if key != 'ANY'
+            ]
+            if rule.get('follow'):
+                keyed.append(())
+            for terminal in self.terminals:
+                explicit = self.get_explicit(non_terminal, terminal)
+                if len(explicit) > 1:
+                    errors.append(
+                        '%s: Ambiguous keys for %s' % (non_terminal, terminal)
+                    )
+                    continue
+                options = self.get_options(non_terminal, terminal)
+                chosen = self.table.predict(rule, terminal)
+                if chosen is None:
+                    chosen = ()
+                # a default (ANY or "") may win a conflict as long as
+                # every other option is still selected by some key
+                if len(options) > 1 and chosen not in explicit and not all(
+                        option == chosen or option in keyed
+                        for option in options
+                ):
+                    errors.append(
+                        '%s: LL(1) conflict on %s between %s'
+                        % (non_terminal, terminal, ' | '.join(
+                            ' '.join(option) or '""' for option in options
+                        ))
+                    )
+        if errors:
+            raise GrammarError(errors)
+
+    def get_entry(self, non_terminal, terminal):
+        return self.table.table[
+            self.table.non_terminal_id[non_terminal]
+            * self.table.terminal_count
+            + self.table.terminal_id[terminal]
+        ]
+
+    def entry_code(self, entry):
+        if entry == EMPTY:
+            return 'EMPTY'
+        elif entry == ERROR:
+            return 'ERROR'
+        else:
+            return str(entry)
+
+    def predict_code(self, non_terminal):
+        lines = [
+            'def expand_%s(token_type, string):' % non_terminal,
+        ]
+        defaults = {}
+        branches = []
+        for token_type, regex in self.token_list:
+            default = self.get_entry(non_terminal, (token_type, None))
+            keywords = []
+            for terminal in self.terminals:
+                if terminal[0] != token_type or terminal[1] is None:
+                    continue
+                entry = self.get_entry(non_terminal, terminal)
+                if entry != default:
+                    keywords.append((terminal[1], entry))
+            defaults[default] = defaults.get(default, 0) + 1
+            branches.append((token_type, default, keywords))
+        # the most common entry is left for the final return
+        fallback = max(defaults, key=lambda entry: defaults[entry])
+        for token_type, default, keywords in branches:
+            if default == fallback and not keywords:
+                continue
+            lines.append('    if token_type == %r:' % token_type)
+            for keyword, entry in keywords:
+                lines.append('        if string == %r:' % keyword)
+                lines.append('            return %s' % self.entry_code(entry))
+            lines.append('        return %s' % self.entry_code(default))
+        lines.append('    return %s' % self.entry_code(fallback))
+        return '\n'.join(lines)
+
+    def generate(self):
+        from syntax import RULES
+        self.check()
+        table = self.table
+        parts = [
+            '# generated by parsergen.py from definition.SYNTAX, do not edit',
+            '\n\nfrom definition import RULE',
+            'from grammar import EMPTY, ERROR',
+            '\n\nGRAMMAR_HASH = %r' % get_grammar_hash(
+                self.syntax, self.token_list
+            ),
+            'KIND = {',
+            ',\n'.join(
+                '    %r: %r' % (symbol, kind)
+                for symbol, kind in table.kind.items()
+            ),
+            '}',
+            'PRODUCTIONS = [',
+            ',\n'.join(
+                '    %r' % (deriv_tuple,) for deriv_tuple in table.productions
+            ),
+            ']'
+        ]
+        for non_terminal in table.non_terminals:
+            parts.append('\n\n' + self.predict_code(non_terminal))
+        parts += [
+            '\n\nEXPAND = {',
+            ',\n'.join(
+                '    %r: expand_%s' % (non_terminal, non_terminal)
+                for non_terminal in table.non_terminals
+            ),
+            '}',
+            'RULES = {',
+            ',\n'.join('    %r: RULE.%s' % (item, item) for item in RULES),
+            '}',
+            '\n\ndef expand(non_terminal, token):',
+            '    return EXPAND[non_terminal](token.token_type, token.string)',
+        ]
+        return '\n'.join(parts) + '\n'
+
+
+def print_sets(generator):
+    for non_terminal in generator.syntax:
+        print('%s%s' % (
+            non_terminal, ' (nullable)'
+            if non_terminal in generator.nullable else ''
+        ))
+        print('  FIRST:  %s' % ' '.join(sorted(generator.first[non_terminal])))
+        print('  FOLLOW: %s' % ' '.join(sorted(generator.follow[non_terminal])))
+
+
+def main():
+    generator = ParserGenerator()
+    if '-v' in sys.argv[1:]:
+        print_sets(generator)
+    try:
+        code = generator.generate()
+    except GrammarError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    with open(OUTPUT, 'w') as f:
+        f.write(code)
+    print(
+        '%s: %d predict functions, %d productions'
+        % (OUTPUT, len(generator.table.non_terminals),
+           len(generator.table.productions))
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,26 @@
 #!/usr/bin/env python3
 
 
+import os
+import re
 import sys
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
 from definition import TOKEN
+import dfa
+
+
+# all token patterns joined into one regex, tried in the order of TOKEN
+MASTER = re.compile('|'.join(
+    '(?P<%s>%s)' % (token_type, regex.pattern) for token_type, regex in TOKEN
+))
+# the same regex over bytes, for sources read through mmap
+MASTER_BYTES = re.compile(MASTER.pattern.encode())
+TRIVIA = ['comment', 'space']
+TOKEN_TYPES = [token_type for token_type, regex in TOKEN]
+TOKEN_ID = {token_type: i for i, token_type in enumerate(TOKEN_TYPES)}
+DFA_TABLES = None # loaded on first use
 
 
 class InvalidTokenException(Exception):
@@ -13,61 +31,667 @@ class InvalidTokenException(Exception):
 
 
 class Token:
-    token_type = ''
-    string = ''
-    coor = (-1, -1)
+    __slots__ = ('token_type', 'string', 'pos', 'positions')
     def __str__(self):
         return (
             "(%s, '%s') at (%d, %d)"
             % (self.token_type, self.string, *self.coor)
         )
-    def __init__(self, token_type, string, coor):
+    def __init__(self, token_type, string, pos, positions=None):
         self.token_type = token_type
         self.string = string
-        self.coor = coor
+        self.pos = pos
+        self.positions = positions
+    @property
+    def coor(self):
+        if self.positions is None:
+            return (-1, -1)
+        return self.positions.get_coordinate(self.pos)
+
+
+class PositionIndex:
+    # maps offsets to (line, col), the line table is built on first use
+    code = '' # str, or bytes-like such as mmap
+    newline = '\n'
+    line_starts = None # array of offsets
+    def __init__(self, code, newline='\n'):
+        self.code = code
+        self.newline = newline
+    def build(self):
+        code = self.code
+        newline = self.newline
+        line_starts = array('q', [0])
+        pos = code.find(newline)
+        while pos >= 0:
+            line_starts.append(pos+1)
+            pos = code.find(newline, pos+1)
+        self.line_starts = line_starts
+    def get_coordinate(self, pos):
+        if pos < 0 or pos > len(self.code):
+            return (-1, -1)
+        if self.line_starts is None:
+            self.build()
+        line_num = bisect_right(self.line_starts, pos)
+        return (line_num, pos-self.line_starts[line_num-1]+1)
+
 
+class TokenView:
+    # Token API over one row of a TokenStream
+    __slots__ = ('stream', 'index')
+    __str__ = Token.__str__
+    def __init__(self, stream, index):
+        self.stream = stream
+        self.index = index
+    @property
+    def token_type(self):
+        return TOKEN_TYPES[self.stream.types[self.index]]
+    @property
+    def string(self):
+        return self.stream.get_string(self.index)
+    @property
+    def pos(self):
+        return self.stream.starts[self.index]
+    @property
+    def coor(self):
+        return self.stream.positions.get_coordinate(self.pos)
 
-def coordinate_generator(code):
-    lines = code.split('\n')
-    line_num = 0 # start from zero
-    line_start = 0
-    last_pos = 0
-    def get_coordinate(pos):
-        nonlocal line_num, line_start, last_pos
-        assert pos >= last_pos
-        last_pos = pos
-        while line_num < len(lines):
-            if line_start <= pos and pos < line_start + len(lines[line_num])+1:
-                return (line_num+1, pos-line_start+1)
-            line_start += len(lines[line_num])+1 # start of the next line
-            line_num += 1 # line number of the next line
-        return (-1, -1)
-    return get_coordinate
-
-
-def get_tokens(code):    
-    pos = 0
-    get_coordinate = coordinate_generator(code);
+
+class TokenStream:
+    # tokens as parallel columns of type ids, start offsets and lengths,
+    # lexemes are sliced from the source when asked for
+    code = ''
+    positions = None # PositionIndex
+    types = None # array
+    starts = None # array
+    lengths = None # array
+    def __init__(self, code, positions):
+        self.code = code
+        self.positions = positions
+        self.types = array('B')
+        self.starts = array('q')
+        self.lengths = array('I')
+    def __len__(self):
+        return len(self.types)
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError('token index out of range')
+        return TokenView(self, index)
+    def __iter__(self):
+        for index in range(0, len(self.types)):
+            yield TokenView(self, index)
+    def get_string(self, index):
+        start = self.starts[index]
+        string = self.code[start:start+self.lengths[index]]
+        if not isinstance(string, str):
+            string = string.decode()
+        return string
+    def fill(self, skip_trivia, engine):
+        types = self.types
+        starts = self.starts
+        lengths = self.lengths
+        for token_type, pos, end in get_spans(
+                self.code, self.positions, skip_trivia, engine
+        ):
+            types.append(TOKEN_ID[token_type])
+            starts.append(pos)
+            lengths.append(end-pos)
+        return self
+
+
+def scan_spans(code, master, positions, skip_trivia, pos=0):
+    match_token = master.match
     while pos < len(code):
-        ok = False
-        coor = get_coordinate(pos)
-        for token_type, regex in TOKEN:
-            match = regex.match(code, pos);
-            if match:
-                match_str = match.group(0)
-                yield Token(token_type, match_str, coor)
-                pos += len(match_str)
-                ok = True
+        match = match_token(code, pos)
+        if not match:
+            raise InvalidTokenException(positions.get_coordinate(pos))
+        token_type = match.lastgroup
+        end = match.end()
+        if not (skip_trivia and token_type in TRIVIA):
+            yield token_type, pos, end
+        pos = end
+
+
+def scan_dfa_spans(code, positions, skip_trivia, pos=0):
+    global DFA_TABLES
+    if DFA_TABLES is None:
+        DFA_TABLES = dfa.load_tables(TOKEN)
+    token_types = DFA_TABLES['token_types']
+    classes = DFA_TABLES['classes']
+    class_count = DFA_TABLES['class_count']
+    trans = DFA_TABLES['trans']
+    accept = DFA_TABLES['accept']
+    other = classes[dfa.OTHER]
+    skipped = [t in TRIVIA for t in token_types]
+    binary = not isinstance(code, str)
+    length = len(code)
+    while pos < length:
+        state = 0
+        i = pos
+        token_id = -1
+        end = pos
+        while i < length:
+            char = code[i] if binary else ord(code[i])
+            state = trans[
+                state*class_count + (classes[char] if char < dfa.OTHER else other)
+            ]
+            if state < 0:
+                break
+            i += 1
+            if accept[state] >= 0:
+                token_id = accept[state]
+                end = i
+        if token_id < 0:
+            raise InvalidTokenException(positions.get_coordinate(pos))
+        if not (skip_trivia and skipped[token_id]):
+            yield token_types[token_id], pos, end
+        pos = end
+
+
+def get_spans(code, positions, skip_trivia, engine, pos=0):
+    if engine == 'regex':
+        master = MASTER if isinstance(code, str) else MASTER_BYTES
+        return scan_spans(code, master, positions, skip_trivia, pos)
+    elif engine == 'dfa':
+        return scan_dfa_spans(code, positions, skip_trivia, pos)
+    else:
+        raise ValueError('%s: No such lexer engine' % engine)
+
+
+def scan(code, spans, positions):
+    # lexemes of bytes-like code are decoded one by one
+    binary = not isinstance(code, str)
+    for token_type, pos, end in spans:
+        string = code[pos:end]
+        if binary:
+            string = string.decode()
+        yield Token(token_type, string, pos, positions)
+
+
+def get_tokens(code, skip_trivia=False, engine='regex'):
+    positions = PositionIndex(code)
+    spans = get_spans(code, positions, skip_trivia, engine)
+    return scan(code, spans, positions)
+
+
+def map_file(file_name):
+    with open(file_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def get_file_tokens(file_name, skip_trivia=False, engine='regex'):
+    # scan a memory-mapped file lazily, columns are counted in bytes
+    code = map_file(file_name)
+    # the mapping lives as long as tokens refer to its PositionIndex
+    positions = PositionIndex(code, b'\n')
+    spans = get_spans(code, positions, skip_trivia, engine)
+    return scan(code, spans, positions)
+
+
+def tokenize(code, skip_trivia=False, engine='regex'):
+    stream = TokenStream(code, PositionIndex(code))
+    return stream.fill(skip_trivia, engine)
+
+
+def tokenize_file(file_name, skip_trivia=False, engine='regex'):
+    code = map_file(file_name)
+    stream = TokenStream(code, PositionIndex(code, b'\n'))
+    return stream.fill(skip_trivia, engine)
+
+
+class WindowPositions:
+    # coordinates of offsets into a slice of code starting at offset
+    __slots__ = ('positions', 'offset')
+    def __init__(self, positions, offset):
+        self.positions = positions
+        self.offset = offset
+    def get_coordinate(self, pos):
+        return self.positions.get_coordinate(pos+self.offset)
+
+
+# text is kept in chunks of about this many characters
+CHUNK = 4096
+# items of a GapList away from its gap are packed this many to a block
+BLOCK = 256
+# how far a match may look past its end, other than a comment that
+# does not close (no keyword is longer than this)
+LOOKAHEAD = 16
+
+
+def item_key(item):
+    return item[0]
+
+
+def get_newlines(code, offset):
+    pos = code.find('\n')
+    while pos >= 0:
+        yield offset + pos
+        pos = code.find('\n', pos+1)
+
+
+class GapList:
+    # items (offset, string, tag) sorted by offset, each spanning its
+    # string, split at a gap: the ones in front of it hold offsets from
+    # the start of code, the ones behind it distances from the end, which
+    # an edit in front of them does not change; away from the gap items
+    # are packed in blocks keyed relative to their first item, so a block
+    # crosses the gap by rebasing it alone
+    front = None # items
+    back = None # (distance, string, tag) items, the nearest last
+    front_blocks = None # (offset, items)
+    back_blocks = None # (distance, items), the nearest last
+    front_counts = None # items in the blocks below each front block
+    back_counts = None
+    def __init__(self, items):
+        self.front = list(items)
+        self.back = []
+        self.front_blocks = []
+        self.back_blocks = []
+        self.front_counts = [0]
+        self.back_counts = [0]
+        self.pack()
+    def __len__(self):
+        return (
+            self.front_counts[-1] + len(self.front)
+            + self.back_counts[-1] + len(self.back)
+        )
+    def iter_front(self):
+        for base, items in self.front_blocks:
+            for key, string, tag in items:
+                yield (base+key, string, tag)
+        yield from self.front
+    def count_front(self):
+        return self.front_counts[-1] + len(self.front)
+    def iter_back(self, length):
+        # items behind the gap with offsets, in order
+        for distance, string, tag in reversed(self.back):
+            yield (length-distance, string, tag)
+        for distance, items in reversed(self.back_blocks):
+            base = length - distance
+            for key, string, tag in items:
+                yield (base+key, string, tag)
+    def push_front_block(self, base, items):
+        self.front_blocks.append((base, items))
+        self.front_counts.append(self.front_counts[-1]+len(items))
+    def push_back_block(self, distance, items):
+        self.back_blocks.append((distance, items))
+        self.back_counts.append(self.back_counts[-1]+len(items))
+    def unpack_front(self):
+        base, items = self.front_blocks.pop()
+        self.front_counts.pop()
+        self.front = [(base+key, string, tag) for key, string, tag in items]
+    def unpack_back(self):
+        distance, items = self.back_blocks.pop()
+        self.back_counts.pop()
+        self.back = [
+            (distance-key, string, tag)
+            for key, string, tag in reversed(items)
+        ]
+    def pack(self, keep=0):
+        # pack all but keep items next to the gap into blocks
+        front = self.front
+        for i in range(0, len(front)-keep, BLOCK):
+            items = front[i:min(i+BLOCK, len(front)-keep)]
+            base = items[0][0]
+            self.push_front_block(base, [
+                (key-base, string, tag) for key, string, tag in items
+            ])
+        del front[:max(len(front)-keep, 0)]
+        back = self.back
+        for i in range(0, len(back)-keep, BLOCK):
+            items = back[i:min(i+BLOCK, len(back)-keep)]
+            distance = items[-1][0]
+            self.push_back_block(distance, [
+                (distance-key, string, tag)
+                for key, string, tag in reversed(items)
+            ])
+        del back[:max(len(back)-keep, 0)]
+    def move(self, length, bound):
+        # put the gap after the items ending before bound
+        front = self.front
+        back = self.back
+        while True:
+            if front:
+                key, string, tag = front[-1]
+                if key+len(string) < bound:
+                    break
+                front.pop()
+                back.append((length-key, string, tag))
+            elif self.front_blocks:
+                base, items = self.front_blocks[-1]
+                key, string, tag = items[0]
+                if base+key+len(string) < bound:
+                    self.unpack_front()
+                    front = self.front
+                    continue
+                if back:
+                    self.pack()
+                self.front_blocks.pop()
+                self.front_counts.pop()
+                self.push_back_block(length-base, items)
+            else:
+                break
+        while True:
+            if back:
+                distance, string, tag = back[-1]
+                if length-distance+len(string) >= bound:
+                    break
+                back.pop()
+                front.append((length-distance, string, tag))
+            elif self.back_blocks:
+                distance, items = self.back_blocks[-1]
+                key, string, tag = items[-1]
+                if length-distance+key+len(string) >= bound:
+                    self.unpack_back()
+                    back = self.back
+                    continue
+                if front:
+                    self.pack()
+                self.back_blocks.pop()
+                self.back_counts.pop()
+                self.push_front_block(length-distance, items)
+            else:
+                break
+        if len(front) > 2*BLOCK or len(back) > 2*BLOCK:
+            self.pack(BLOCK)
+    def pop_front(self):
+        if not self.front:
+            self.unpack_front()
+        return self.front.pop()
+    def push_back(self, length, item):
+        key, string, tag = item
+        self.back.append((length-key, string, tag))
+    def push_front(self, items):
+        self.front.extend(items)
+    def drop_back(self, count):
+        while count > 0:
+            if not self.back:
+                if len(self.back_blocks[-1][1]) <= count:
+                    count -= len(self.back_blocks.pop()[1])
+                    self.back_counts.pop()
+                    continue
+                self.unpack_back()
+            drop = min(count, len(self.back))
+            del self.back[len(self.back)-drop:]
+            count -= drop
+    def find(self, length, pos):
+        # the count of items with offsets before pos and the last of them
+        back = self.back
+        back_blocks = self.back_blocks
+        total = self.front_counts[-1] + len(self.front)
+        if back and length-back[-1][0] < pos:
+            i = bisect_right(back, length-pos, key=item_key)
+            if i > 0 or not back_blocks:
+                distance, string, tag = back[i]
+                return total+len(back)-i, (length-distance, string, tag)
+        elif back:
+            back_blocks = None
+        if back_blocks:
+            i = bisect_right(back_blocks, length-pos, key=item_key)
+            if i < len(back_blocks):
+                distance, items = back_blocks[i]
+                base = length - distance
+                j = bisect_left(items, pos-base, key=item_key)
+                key, string, tag = items[j-1]
+                count = (
+                    total + len(back) + self.back_counts[-1]
+                    - self.back_counts[i+1] + j
+                )
+                return count, (base+key, string, tag)
+            if back:
+                distance, string, tag = back[0]
+                return total+len(back), (length-distance, string, tag)
+        front = self.front
+        if front and front[0][0] < pos:
+            i = bisect_left(front, pos, key=item_key)
+            return self.front_counts[-1] + i, front[i-1]
+        i = bisect_left(self.front_blocks, pos, key=item_key)
+        if i == 0:
+            return 0, None
+        base, items = self.front_blocks[i-1]
+        j = bisect_left(items, pos-base, key=item_key)
+        key, string, tag = items[j-1]
+        return self.front_counts[i-1] + j, (base+key, string, tag)
+
+
+class IncrementalScanner:
+    # code under edit and its tokens: the text is a gap buffer of chunks
+    # split at the last edit, tokens and newlines are GapLists; an edit
+    # costs time in proportion to its size, to the tokens it changes and
+    # to the blocks and chunks between it and the previous edit
+    length = 0
+    head = None # text chunks in front of the gap
+    head_length = 0
+    tail = None # text chunks behind the gap, reversed
+    tokens = None # GapList of (offset, string, token_type)
+    newlines = None # GapList of (offset, '\n', None)
+    open_comments = None # offsets of '/' starting a comment not closed
+    def __init__(self, code, skip_trivia=False, engine='regex'):
+        self.skip_trivia = skip_trivia
+        self.engine = engine
+        self.length = len(code)
+        self.head = [code[i:i+CHUNK] for i in range(0, len(code), CHUNK)]
+        self.head_length = len(code)
+        self.tail = []
+        self.newlines = GapList(
+            (pos, '\n', None) for pos in get_newlines(code, 0)
+        )
+        tokens = []
+        self.open_comments = []
+        for token_type, pos, end in get_spans(
+                code, self, skip_trivia, engine
+        ):
+            tokens.append((pos, code[pos:end], token_type))
+            if code.startswith('/*', pos) and token_type != 'comment':
+                self.open_comments.append(pos)
+        self.tokens = GapList(tokens)
+    def __len__(self):
+        return len(self.tokens)
+    def __iter__(self):
+        for pos, string, token_type in self.tokens.iter_front():
+            yield Token(token_type, string, pos, self)
+        for pos, string, token_type in self.tokens.iter_back(self.length):
+            yield Token(token_type, string, pos, self)
+    @property
+    def code(self):
+        return ''.join(self.head) + ''.join(reversed(self.tail))
+    def get_text(self, start, stop):
+        # code[start:stop] from the chunks around the gap, in time in
+        # proportion to the distance of both ends from the gap
+        head = self.head
+        tail = self.tail
+        pieces = []
+        if start < self.head_length:
+            i = len(head)
+            pos = self.head_length
+            while pos > start:
+                i -= 1
+                pos -= len(head[i])
+            pieces.append(''.join(head[i:])[start-pos:stop-pos])
+        i = len(tail)
+        pos = self.head_length
+        while pos < stop and i > 0:
+            i -= 1
+            if pos+len(tail[i]) > start:
+                pieces.append(tail[i][max(start-pos, 0):stop-pos])
+            pos += len(tail[i])
+        return ''.join(pieces)
+    def get_coordinate(self, pos):
+        if pos < 0 or pos > self.length:
+            return (-1, -1)
+        count, newline = self.newlines.find(self.length, pos)
+        if newline is None:
+            return (1, pos+1)
+        return (count+1, pos-newline[0])
+    def move_text(self, offset):
+        head = self.head
+        tail = self.tail
+        while self.head_length > offset:
+            chunk = head.pop()
+            self.head_length -= len(chunk)
+            tail.append(chunk)
+        while self.head_length < offset:
+            chunk = tail.pop()
+            self.head_length += len(chunk)
+            head.append(chunk)
+        if self.head_length > offset:
+            chunk = head.pop()
+            split = len(chunk) - (self.head_length-offset)
+            head.append(chunk[:split])
+            tail.append(chunk[split:])
+            self.head_length = offset
+    def replace_text(self, offset, deleted, inserted):
+        # returns the deleted text
+        self.move_text(offset)
+        tail = self.tail
+        pieces = []
+        while deleted > 0:
+            chunk = tail.pop()
+            if len(chunk) > deleted:
+                tail.append(chunk[deleted:])
+                chunk = chunk[:deleted]
+            pieces.append(chunk)
+            deleted -= len(chunk)
+        head = self.head
+        if head and len(head[-1]) + len(inserted) <= CHUNK:
+            head[-1] += inserted
+        else:
+            for i in range(0, len(inserted), CHUNK):
+                head.append(inserted[i:i+CHUNK])
+        removed = ''.join(pieces)
+        self.head_length += len(inserted)
+        # newlines behind the deleted text keep their distances
+        newlines = self.newlines
+        newlines.move(self.length, offset+1)
+        count = 0
+        for pos, string, tag in newlines.iter_back(self.length):
+            if pos >= offset+len(removed):
+                break
+            count += 1
+        newlines.drop_back(count)
+        newlines.push_front(
+            (pos, '\n', None) for pos in get_newlines(inserted, offset)
+        )
+        self.length += len(inserted) - len(removed)
+        return removed
+    def may_close(self, offset, deleted, inserted):
+        # whether a comment left open in front of the edit may close,
+        # which takes a '*/' in the run of '*' the edit touches, as a '*'
+        # pairs with the character after it inside a comment
+        size = 1
+        while True:
+            before = self.get_text(max(offset-size, 0), offset)
+            if before.strip('*') or size >= offset:
+                break
+            size *= 2
+        before = before[len(before.rstrip('*')):]
+        size = 1
+        while True:
+            after = self.get_text(offset+deleted, offset+deleted+size)
+            if after.strip('*') or offset+deleted+size >= self.length:
                 break
-        if not ok:
-            raise InvalidTokenException(coor)
+            size *= 2
+        after = after[:len(after)-len(after.lstrip('*'))+1]
+        return '*/' in before + inserted + after
+    def edit(self, offset, deleted, inserted):
+        # replace deleted characters at offset with inserted and patch
+        # the tokens, returns (index, removed, added): the tokens from
+        # index on, removed of them, were replaced with added new ones
+        if offset < 0 or deleted < 0 or offset+deleted > self.length:
+            raise ValueError('Edit out of range')
+        tokens = self.tokens
+        # tokens before the edit may still change because a match looks
+        # one character past its end, so start from the token before that
+        tokens.move(self.length, offset)
+        if tokens.count_front():
+            token = tokens.pop_front()
+            tokens.push_back(self.length, token)
+            start = token[0]
+        else:
+            start = 0
+        # '/' followed by '*' is a comment that failed to close, its match
+        # looked up to the end of code and may succeed after the edit
+        open_comments = self.open_comments
+        if open_comments and open_comments[0] < start and self.may_close(
+                offset, deleted, inserted
+        ):
+            start = open_comments[0]
+            tokens.move(self.length, start+1)
+        removed_text = self.replace_text(offset, deleted, inserted)
+        try:
+            added, removed, end, opened = self.scan(
+                start, offset+len(inserted)
+            )
+        except InvalidTokenException:
+            self.replace_text(offset, len(inserted), removed_text)
+            raise
+        tokens.drop_back(removed)
+        index = tokens.count_front()
+        tokens.push_front(added)
+        delta = len(inserted) - deleted
+        self.open_comments = [
+            pos for pos in open_comments if pos < start
+        ] + opened + [
+            pos+delta for pos in open_comments
+            if pos >= offset+deleted and pos+delta >= end
+        ]
+        return (index, removed, len(added))
+    def scan(self, start, edit_end):
+        # scan from start until a token behind the edit starts where an
+        # old one does, reading the code in growing windows; returns the
+        # new tokens, the count of old ones they replace, where the old
+        # ones are kept from and the open comments among the new ones
+        old_tokens = self.tokens.iter_back(self.length)
+        old = next(old_tokens, None)
+        removed = 0
+        added = []
+        opened = []
+        size = edit_end - start + CHUNK
+        while True:
+            stop = min(start+size, self.length)
+            window = self.get_text(start, stop)
+            at_end = stop == self.length
+            spans = get_spans(
+                window, WindowPositions(self, start), False, self.engine
+            )
+            scanned = 0 # matches up to here do not change with more code
+            try:
+                for token_type, pos, end in spans:
+                    open_comment = (
+                        window.startswith('/*', pos)
+                        and token_type != 'comment'
+                    )
+                    if not at_end and (
+                            end+LOOKAHEAD > len(window) or open_comment
+                    ):
+                        break
+                    scanned = end
+                    if start+pos >= edit_end:
+                        while old is not None and old[0] < start+pos:
+                            old = next(old_tokens, None)
+                            removed += 1
+                        if old is not None and old[0] == start+pos:
+                            return added, removed, start+pos, opened
+                    if open_comment:
+                        opened.append(start+pos)
+                    if not (self.skip_trivia and token_type in TRIVIA):
+                        added.append((start+pos, window[pos:end], token_type))
+            except InvalidTokenException:
+                if at_end or len(window)-scanned > LOOKAHEAD:
+                    raise
+            if at_end:
+                removed = len(self.tokens) - self.tokens.count_front()
+                return added, removed, self.length, opened
+            start += scanned
+            size *= 2
 
 
 def process_file(file_name):
-    f = open(file_name, 'r')
-    for token in get_tokens(f.read()):
+    for token in tokenize_file(file_name):
         print(token)
-    f.close()
 
 
 def main():
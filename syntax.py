@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 
 
-import re
 import sys
-from definition import TOKEN, SYNTAX, RULE
-from scanner import get_tokens
-from common import e_print
+from types import MappingProxyType
+from definition import SYNTAX, RULE, OPERATOR_PRECEDENCE, Scope
+from grammar import (
+    ParseTable, classify_symbol, get_kinds, get_grammar_hash, EMPTY, ERROR
+)
+from scanner import get_tokens, get_file_tokens
+from common import DEBUG, e_print
 
 
 class InvalidSyntaxException(Exception):
@@ -16,6 +19,11 @@ class InvalidSyntaxException(Exception):
         return 'Invalid Syntax at Line %d, Col %d' % self.coor
 
 
+class OutdatedParserException(Exception):
+    def __str__(self):
+        return 'syntax_parser.py does not match SYNTAX, run parsergen.py'
+
+
 class SyntaxError(Exception):
     def __init__(self, coor, msg):
         self.coor = coor
@@ -25,175 +33,258 @@ class SyntaxError(Exception):
         return 'Syntax Error at Line %d, Col %d:\n\t%s' % (*self.coor, self.msg)
 
 
+# shared by all terminals, rules only set properties of non-terminals
+LEAF_PROPERTIES = MappingProxyType({})
+
+
 class SyntaxTreeNode:
-    syntax_item = ''
-    children = None # list, reference type
-    properties = None # dict
-    parent = None
-    token = None
-    function = None
-    processed = False
-    deriv_tuple = ()
+    __slots__ = (
+        'syntax_item',
+        'children', # list, empty tuple for leaves
+        'properties', # dict
+        'parent',
+        'token',
+        'function',
+        'processed',
+        'pending', # children not processed yet
+        'deriv_tuple'
+    )
     def __init__(self, syntax_item):
         self.syntax_item = syntax_item
-        self.children = []
-        self.properties = {}
+        self.children = ()
+        self.parent = None
+        self.token = None
+        self.function = None
+        self.processed = False
+        self.pending = 0
+        self.deriv_tuple = ()
+        kind = KIND.get(syntax_item) or get_syntax_item_type(syntax_item)
+        if kind == 'non-terminal':
+            self.properties = {}
+        else:
+            self.properties = LEAF_PROPERTIES
         if syntax_item == 'Function':
             self.function = self
-            self.properties['symbols'] = {}
 
     def get_type(self):
         return get_syntax_item_type(self.syntax_item)
 
-    def check_processed(self):
-        has_unprocessed = False
-        for child in self.children:
-            if not child.processed:
-                has_unprocessed = True
-                break
-        if not has_unprocessed:
-            self.processed = True
-            if self.parent:
-                self.parent.check_processed()
+    def set_processed(self):
+        # a parent is processed once its last pending child is
+        self.processed = True
+        node = self.parent
+        while node:
+            node.pending -= 1
+            if node.pending:
+                return
+            node.processed = True
+            node = node.parent
 
     def match_token(self, token):
         item_type = self.get_type()
         assert item_type != 'non-terminal'
-        def match():
-            self.token = token
-            self.processed = True
-            if self.parent:
-                self.parent.check_processed()
         if item_type == 'token_type':
-            if token.token_type == self.syntax_item:
-                match()
-                return True
-            else:
-                return False
+            matched = token.token_type == self.syntax_item
         elif item_type == 'string':
-            if token.string == self.syntax_item:
-                match()
-                return True
-            else:
-                return False
+            matched = token.string == self.syntax_item
         else:
-            return False
+            matched = False
+        if matched:
+            self.token = token
+            self.set_processed()
+        return matched
 
     def set_empty(self):
-        self.processed = True
-        if self.parent:
-            self.parent.check_processed()
+        self.set_processed()
 
-    def produce_children_reversed(self, derivation_tuple):
-        for item in reversed(derivation_tuple):
+    def produce_children(self, derivation_tuple):
+        children = []
+        for item in derivation_tuple:
             new_node = SyntaxTreeNode(item)
             new_node.parent = self
             if self.function:
                 new_node.function = self.function
-            self.children.insert(0, new_node)
-            yield new_node
+            children.append(new_node)
+        self.children = children
+        self.pending = len(derivation_tuple)
+        return children
+
+
+KIND = get_kinds(SYNTAX)
+RULES = {
+    item: getattr(RULE, item)
+    for item in [*SYNTAX, 'Binary'] if hasattr(RULE, item)
+}
+
+
+# parsers by engine, built on first use
+PARSERS = {}
 
 
 def get_syntax_item_type(string):
-    if re.compile('[A-Z]').match(string):
-        return 'non-terminal'
-    else:
-        for token_type, regex in TOKEN:
-            if string == token_type:
-                return 'token_type'            
-        return 'string'
+    kind = KIND.get(string)
+    if kind is None:
+        kind = classify_symbol(string)
+    return kind
+
+
+def get_parser(engine):
+    # (kind, productions, expand, rules) of the engine: 'table' compiles
+    # SYNTAX into a ParseTable, 'generated' loads the module written by
+    # parsergen.py
+    if engine not in PARSERS:
+        if engine == 'table':
+            table = ParseTable()
+            PARSERS[engine] = (
+                table.kind, table.productions, table.expand, RULES
+            )
+        elif engine == 'generated':
+            import syntax_parser
+            if syntax_parser.GRAMMAR_HASH != get_grammar_hash():
+                raise OutdatedParserException()
+            PARSERS[engine] = (
+                syntax_parser.KIND, syntax_parser.PRODUCTIONS,
+                syntax_parser.expand, syntax_parser.RULES
+            )
+        else:
+            raise ValueError('%s: No such parser engine' % engine)
+    return PARSERS[engine]
+
 
+def get_syntax_tree(code, engine='table', on_function=None):
+    return build_syntax_tree(
+        get_tokens(code, skip_trivia=True), engine, on_function
+    )
 
-def get_syntax_tree(code):
-    root = SyntaxTreeNode('Program')
-    symbols = {'_functions': {}}
+
+def get_file_syntax_tree(file_name, engine='table', on_function=None):
+    return build_syntax_tree(
+        get_file_tokens(file_name, skip_trivia=True), engine, on_function
+    )
+
+
+def build_syntax_tree(tokens, engine='table', on_function=None,
+                      start='Program', symbols=None):
+    # on_function(node) is called for every checked Function and returns
+    # the node to keep in its place, so the subtree can be freed;
+    # symbols is the global Scope, a part of a program can be parsed
+    # from another start symbol against the globals of the rest
+    root = SyntaxTreeNode(start)
+    if symbols is None:
+        symbols = Scope()
     syntax_stack = []
     syntax_stack.append(root)
-    
-    def process_token(token):
-        def set_properties(node):
-            if node.processed:
-                if hasattr(RULE, node.syntax_item):
-                    check_f = getattr(RULE, node.syntax_item)
-                    result = check_f(symbols, node)
-                    if result.ok:
-                        if node.parent:
-                            set_properties(node.parent)
-                    else:
-                        raise SyntaxError(token.coor, result.msg)
-                else:
-                    if node.parent:
-                        set_properties(node.parent)
-        e_print('-- Processing Token ' + str(token))
-        if not syntax_stack:
-            raise InvalidSyntaxException(token.coor)
-        current_node = syntax_stack.pop()
-        def push_children(deriv_tuple):
-            for child in current_node.produce_children_reversed(deriv_tuple):
-                syntax_stack.append(child)
-                e_print('Push [%s]' % child.syntax_item)
-        if current_node.get_type() == 'non-terminal':
-            e_print(
-                'Try to expand [%s]'
-                % current_node.syntax_item
+    kind, productions, expand, rules = get_parser(engine)
+
+    def check(node, token):
+        check_f = rules.get(node.syntax_item)
+        if check_f:
+            result = check_f(symbols, node)
+            if not result.ok:
+                raise SyntaxError(token.coor, result.msg)
+
+    def fold_expression(node, token):
+        # Expr -> Unary ExprRight, ExprRight -> "" | op Unary ExprRight
+        # becomes a tree of Binary -> Oprand op Oprand by precedence
+        # climbing over the flat list of operands and operators
+        oprands = [node.children[0]]
+        ops = []
+        def reduce():
+            op = ops.pop()
+            right = oprands.pop()
+            left = oprands.pop()
+            binary = SyntaxTreeNode('Binary')
+            binary.children = [left, op, right]
+            binary.deriv_tuple = (
+                left.syntax_item, op.syntax_item, right.syntax_item
             )
-            syntax = SYNTAX[current_node.syntax_item]
-            expanded = False
-            skip = False
-            if syntax.get('follow'):
-                 follow = syntax['follow']
-                 if get_syntax_item_type(follow) == 'token_type':
-                     if follow == token.token_type:
-                         skip = True
-                 else:
-                     if follow == token.string:
-                         skip = True
-            for first, deriv_tuple in syntax['derivations']:
-                if skip:
-                    break
-                if first == 'ANY':
-                    expanded = True
+            binary.function = node.function
+            binary.processed = True
+            for child in binary.children:
+                child.parent = binary
+            check(binary, token)
+            oprands.append(binary)
+        right = node.children[1]
+        while right.children:
+            op, oprand, right = right.children
+            precedence = OPERATOR_PRECEDENCE[op.syntax_item]
+            while (
+                    ops
+                    and OPERATOR_PRECEDENCE[ops[-1].syntax_item] >= precedence
+            ):
+                reduce()
+            ops.append(op)
+            oprands.append(oprand)
+        while ops:
+            reduce()
+        item = oprands[0]
+        item.parent = node
+        node.children = [item]
+        node.deriv_tuple = (item.syntax_item,)
+
+    def set_properties(node, token):
+        # evaluate the rules of the nodes completed by the last step,
+        # from the bottom up
+        while node and node.processed:
+            if node.syntax_item == 'Expr':
+                fold_expression(node, token)
+            check(node, token)
+            if on_function and node.syntax_item == 'Function':
+                node = replace_function(node)
+            node = node.parent
+
+    def replace_function(node):
+        replacement = on_function(node)
+        replacement.processed = True
+        replacement.parent = node.parent
+        if node.parent:
+            siblings = node.parent.children
+            siblings[siblings.index(node)] = replacement
+        return replacement
+
+    last_token = None
+    for token in tokens:
+        last_token = token
+        if DEBUG:
+            e_print('-- Processing Token ' + str(token))
+        # expand non-terminals until a terminal consumes the token
+        while True:
+            if not syntax_stack:
+                raise InvalidSyntaxException(token.coor)
+            current_node = syntax_stack.pop()
+            if kind[current_node.syntax_item] == 'non-terminal':
+                if DEBUG:
+                    e_print('Try to expand [%s]' % current_node.syntax_item)
+                entry = expand(current_node.syntax_item, token)
+                if entry == ERROR:
+                    raise InvalidSyntaxException(token.coor)
+                elif entry == EMPTY:
+                    if DEBUG:
+                        e_print('Expanded by ""')
+                    current_node.set_empty()
+                    set_properties(current_node, token)
                 else:
-                    if get_syntax_item_type(first) == 'token_type':
-                        if first == token.token_type:
-                            expanded = True                    
-                    else:
-                        # string
-                        if first == token.string:
-                            expanded = True
-                if expanded:
-                    push_children(deriv_tuple)
+                    deriv_tuple = productions[entry]
+                    children = current_node.produce_children(deriv_tuple)
+                    for child in reversed(children):
+                        syntax_stack.append(child)
+                        if DEBUG:
+                            e_print('Push [%s]' % child.syntax_item)
                     current_node.deriv_tuple = deriv_tuple
-                    #e_print('derive_tuple=%s' % str(deriv_tuple))
+                    if current_node.syntax_item == 'Function':
+                        current_node.properties['scope'] = Scope(symbols)
+                    if DEBUG:
+                        e_print('Expanded by %s' % str(deriv_tuple))
+            else:
+                if DEBUG:
+                    e_print('Try to match [%s]' % current_node.syntax_item)
+                if current_node.match_token(token):
+                    if DEBUG:
+                        e_print('Matched %s' % token.string)
+                    set_properties(current_node, token)
                     break
-            if not expanded:
-                if syntax['empty']:
-                    e_print('Expanded by ""')
-                    current_node.set_empty()
-                    set_properties(current_node)
-                    process_token(token)
                 else:
                     raise InvalidSyntaxException(token.coor)
-            else:
-                e_print('Expanded by %s' % str(deriv_tuple))
-                process_token(token)
-        else:
-            e_print(
-                'Try to match [%s]'
-                % current_node.syntax_item
-            )
-            if(current_node.match_token(token)):
-                e_print('Matched %s' % token.string)
-                set_properties(current_node)
-            else:
-                raise InvalidSyntaxException(token.coor)
-
-    for token in get_tokens(code):
-        if token.token_type in ['comment', 'space']:
-            continue
-        else:
-            process_token(token)
-    last_token = token
 
     while (
             syntax_stack
@@ -223,10 +314,8 @@ def print_syntax_tree(node, depth=0):
 
 
 def process_file(file_name):
-    f = open(file_name, 'r')
-    root = get_syntax_tree(f.read())
+    root = get_file_syntax_tree(file_name)
     print_syntax_tree(root)
-    f.close()
 
 
 def main():
@@ -0,0 +1,452 @@
+# generated by parsergen.py from definition.SYNTAX, do not edit
+
+
+from definition import RULE
+from grammar import EMPTY, ERROR
+
+
+GRAMMAR_HASH = '30e1d832705029cdaf4f6e72bf8ffd9d1dff0e1f'
+KIND = {
+    'Program': 'non-terminal',
+    'Decls': 'non-terminal',
+    'Functions': 'non-terminal',
+    'def': 'string',
+    'Function': 'non-terminal',
+    'ident': 'token_type',
+    '(': 'string',
+    'ParaList': 'non-terminal',
+    ')': 'string',
+    'FunctionBody': 'non-terminal',
+    'type_key': 'token_type',
+    'Type': 'non-terminal',
+    'ParaListRight': 'non-terminal',
+    ',': 'string',
+    '{': 'string',
+    'Stmts': 'non-terminal',
+    '}': 'string',
+    '->': 'string',
+    'FunctionType': 'non-terminal',
+    'Block': 'non-terminal',
+    'Decl': 'non-terminal',
+    ';': 'string',
+    'TypeRight': 'non-terminal',
+    '[': 'string',
+    'integer_value': 'token_type',
+    ']': 'string',
+    'Stmt': 'non-terminal',
+    'key': 'token_type',
+    'cond_key': 'token_type',
+    'Assign': 'non-terminal',
+    'read': 'string',
+    'Var': 'non-terminal',
+    'print': 'string',
+    'Expr': 'non-terminal',
+    'eval': 'string',
+    'if': 'string',
+    'Else': 'non-terminal',
+    'while': 'string',
+    'do': 'string',
+    'for': 'string',
+    'break': 'string',
+    'continue': 'string',
+    'return': 'string',
+    'ReturnValue': 'non-terminal',
+    '=': 'string',
+    'else': 'string',
+    'VarCall': 'non-terminal',
+    'VarCallRight': 'non-terminal',
+    'VarRight': 'non-terminal',
+    'ArgListWrapper': 'non-terminal',
+    'ArgList': 'non-terminal',
+    'ArgListRight': 'non-terminal',
+    'Unary': 'non-terminal',
+    'ExprRight': 'non-terminal',
+    '||': 'string',
+    '&&': 'string',
+    '==': 'string',
+    '!=': 'string',
+    '<': 'string',
+    '<=': 'string',
+    '>': 'string',
+    '>=': 'string',
+    '+': 'string',
+    '-': 'string',
+    '*': 'string',
+    '/': 'string',
+    '!': 'string',
+    'ParExpr': 'non-terminal',
+    'Oprand': 'non-terminal',
+    'double_value': 'token_type',
+    'bool_value': 'token_type'
+}
+PRODUCTIONS = [
+    ('Decls', 'Functions'),
+    ('Function', 'Functions'),
+    ('def', 'ident', '(', 'ParaList', ')', 'FunctionBody'),
+    ('Type', 'ident', 'ParaListRight'),
+    (',', 'Type', 'ident', 'ParaListRight'),
+    ('{', 'Decls', 'Stmts', '}'),
+    ('FunctionType', '{', 'Decls', 'Stmts', '}'),
+    ('->', 'Type'),
+    ('{', 'Stmts', '}'),
+    ('Decl', 'Decls'),
+    ('Type', 'ident', ';'),
+    ('type_key', 'TypeRight'),
+    ('[', 'integer_value', ']', 'TypeRight'),
+    ('Stmt', 'Stmts'),
+    ('Assign', ';'),
+    ('read', 'Var', ';'),
+    ('print', 'Expr', ';'),
+    ('eval', 'Expr', ';'),
+    ('if', '(', 'Expr', ')', 'Stmt', 'Else'),
+    ('while', '(', 'Expr', ')', 'Stmt'),
+    ('do', 'Stmt', 'while', '(', 'Expr', ')', ';'),
+    ('for', '(', 'Assign', ';', 'Expr', ';', 'Assign', ')', 'Stmt'),
+    ('break', ';'),
+    ('continue', ';'),
+    ('return', 'ReturnValue'),
+    ('Block',),
+    ('Expr',),
+    (';',),
+    ('Expr', ';'),
+    ('Var', '=', 'Expr'),
+    ('else', 'Stmt'),
+    ('ident', 'VarCallRight'),
+    ('VarRight',),
+    ('ArgListWrapper',),
+    ('ident', 'VarRight'),
+    ('[', 'Expr', ']', 'VarRight'),
+    ('(', 'ArgList', ')'),
+    ('Expr', 'ArgListRight'),
+    (',', 'Expr', 'ArgListRight'),
+    ('Unary', 'ExprRight'),
+    ('||', 'Unary', 'ExprRight'),
+    ('&&', 'Unary', 'ExprRight'),
+    ('==', 'Unary', 'ExprRight'),
+    ('!=', 'Unary', 'ExprRight'),
+    ('<', 'Unary', 'ExprRight'),
+    ('<=', 'Unary', 'ExprRight'),
+    ('>', 'Unary', 'ExprRight'),
+    ('>=', 'Unary', 'ExprRight'),
+    ('+', 'Unary', 'ExprRight'),
+    ('-', 'Unary', 'ExprRight'),
+    ('*', 'Unary', 'ExprRight'),
+    ('/', 'Unary', 'ExprRight'),
+    ('+', 'Unary'),
+    ('-', 'Unary'),
+    ('!', 'Unary'),
+    ('ParExpr',),
+    ('Oprand',),
+    ('(', 'Expr', ')'),
+    ('VarCall',),
+    ('integer_value',),
+    ('double_value',),
+    ('bool_value',)
+]
+
+
+def expand_Program(token_type, string):
+    return 0
+
+
+def expand_Functions(token_type, string):
+    if token_type == 'ident':
+        if string == 'def':
+            return 1
+        return EMPTY
+    return EMPTY
+
+
+def expand_Function(token_type, string):
+    return 2
+
+
+def expand_ParaList(token_type, string):
+    if token_type == 'type_key':
+        return 3
+    return EMPTY
+
+
+def expand_ParaListRight(token_type, string):
+    if token_type == 'op':
+        if string == ',':
+            return 4
+        return EMPTY
+    return EMPTY
+
+
+def expand_FunctionBody(token_type, string):
+    if token_type == 'op':
+        if string == '{':
+            return 5
+        if string == '->':
+            return 6
+        return ERROR
+    return ERROR
+
+
+def expand_FunctionType(token_type, string):
+    return 7
+
+
+def expand_Block(token_type, string):
+    return 8
+
+
+def expand_Decls(token_type, string):
+    if token_type == 'type_key':
+        return 9
+    return EMPTY
+
+
+def expand_Decl(token_type, string):
+    return 10
+
+
+def expand_Type(token_type, string):
+    return 11
+
+
+def expand_TypeRight(token_type, string):
+    if token_type == 'op':
+        if string == '[':
+            return 12
+        return EMPTY
+    return EMPTY
+
+
+def expand_Stmts(token_type, string):
+    if token_type == 'cond_key':
+        return 13
+    if token_type == 'key':
+        return 13
+    if token_type == 'op':
+        if string == '{':
+            return 13
+        return EMPTY
+    if token_type == 'ident':
+        return 13
+    return EMPTY
+
+
+def expand_Stmt(token_type, string):
+    if token_type == 'cond_key':
+        if string == 'if':
+            return 18
+        if string == 'while':
+            return 19
+        if string == 'do':
+            return 20
+        if string == 'for':
+            return 21
+        if string == 'break':
+            return 22
+        if string == 'continue':
+            return 23
+        return 26
+    if token_type == 'key':
+        if string == 'read':
+            return 15
+        if string == 'print':
+            return 16
+        if string == 'eval':
+            return 17
+        if string == 'return':
+            return 24
+        return 26
+    if token_type == 'op':
+        if string == '{':
+            return 25
+        return 26
+    if token_type == 'ident':
+        return 14
+    return 26
+
+
+def expand_ReturnValue(token_type, string):
+    if token_type == 'op':
+        if string == ';':
+            return 27
+        return 28
+    return 28
+
+
+def expand_Assign(token_type, string):
+    return 29
+
+
+def expand_Else(token_type, string):
+    if token_type == 'cond_key':
+        if string == 'else':
+            return 30
+        return EMPTY
+    return EMPTY
+
+
+def expand_VarCall(token_type, string):
+    return 31
+
+
+def expand_VarCallRight(token_type, string):
+    if token_type == 'op':
+        if string == '(':
+            return 33
+        if string == '[':
+            return 32
+        return EMPTY
+    return EMPTY
+
+
+def expand_Var(token_type, string):
+    return 34
+
+
+def expand_VarRight(token_type, string):
+    if token_type == 'op':
+        if string == '[':
+            return 35
+        return EMPTY
+    return EMPTY
+
+
+def expand_ArgListWrapper(token_type, string):
+    return 36
+
+
+def expand_ArgList(token_type, string):
+    if token_type == 'op':
+        if string == ')':
+            return EMPTY
+        return 37
+    return 37
+
+
+def expand_ArgListRight(token_type, string):
+    if token_type == 'op':
+        if string == ',':
+            return 38
+        return EMPTY
+    return EMPTY
+
+
+def expand_Expr(token_type, string):
+    return 39
+
+
+def expand_ExprRight(token_type, string):
+    if token_type == 'op':
+        if string == '||':
+            return 40
+        if string == '&&':
+            return 41
+        if string == '==':
+            return 42
+        if string == '!=':
+            return 43
+        if string == '<':
+            return 44
+        if string == '<=':
+            return 45
+        if string == '>':
+            return 46
+        if string == '>=':
+            return 47
+        if string == '+':
+            return 48
+        if string == '-':
+            return 49
+        if string == '*':
+            return 50
+        if string == '/':
+            return 51
+        return EMPTY
+    return EMPTY
+
+
+def expand_Unary(token_type, string):
+    if token_type == 'op':
+        if string == '(':
+            return 55
+        if string == '+':
+            return 52
+        if string == '-':
+            return 53
+        if string == '!':
+            return 54
+        return 56
+    return 56
+
+
+def expand_ParExpr(token_type, string):
+    return 57
+
+
+def expand_Oprand(token_type, string):
+    if token_type == 'bool_value':
+        return 61
+    if token_type == 'double_value':
+        return 60
+    if token_type == 'integer_value':
+        return 59
+    if token_type == 'ident':
+        return 58
+    return ERROR
+
+
+EXPAND = {
+    'Program': expand_Program,
+    'Functions': expand_Functions,
+    'Function': expand_Function,
+    'ParaList': expand_ParaList,
+    'ParaListRight': expand_ParaListRight,
+    'FunctionBody': expand_FunctionBody,
+    'FunctionType': expand_FunctionType,
+    'Block': expand_Block,
+    'Decls': expand_Decls,
+    'Decl': expand_Decl,
+    'Type': expand_Type,
+    'TypeRight': expand_TypeRight,
+    'Stmts': expand_Stmts,
+    'Stmt': expand_Stmt,
+    'ReturnValue': expand_ReturnValue,
+    'Assign': expand_Assign,
+    'Else': expand_Else,
+    'VarCall': expand_VarCall,
+    'VarCallRight': expand_VarCallRight,
+    'Var': expand_Var,
+    'VarRight': expand_VarRight,
+    'ArgListWrapper': expand_ArgListWrapper,
+    'ArgList': expand_ArgList,
+    'ArgListRight': expand_ArgListRight,
+    'Expr': expand_Expr,
+    'ExprRight': expand_ExprRight,
+    'Unary': expand_Unary,
+    'ParExpr': expand_ParExpr,
+    'Oprand': expand_Oprand
+}
+RULES = {
+    'Function': RULE.Function,
+    'ParaList': RULE.ParaList,
+    'ParaListRight': RULE.ParaListRight,
+    'FunctionBody': RULE.FunctionBody,
+    'FunctionType': RULE.FunctionType,
+    'Decl': RULE.Decl,
+    'Type': RULE.Type,
+    'Stmt': RULE.Stmt,
+    'ReturnValue': RULE.ReturnValue,
+    'VarCall': RULE.VarCall,
+    'VarCallRight': RULE.VarCallRight,
+    'Var': RULE.Var,
+    'ArgListWrapper': RULE.ArgListWrapper,
+    'ArgList': RULE.ArgList,
+    'ArgListRight': RULE.ArgListRight,
+    'Expr': RULE.Expr,
+    'Unary': RULE.Unary,
+    'ParExpr': RULE.ParExpr,
+    'Oprand': RULE.Oprand,
+    'Binary': RULE.Binary
+}
+
+
+def expand(non_terminal, token):
+    return EXPAND[non_terminal](token.token_type, token.string)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# time of translating generated programs of growing size, as nested
+# blocks, as nested parentheses and as a flat chain of statements;
+# translation is linear when the time per instruction stays flat; as
+# in timeit the garbage collector is off while timing, its full
+# collections would scan the whole tree again and again
+#
+#     python3 test/bench_translate.py [size]
+
+
+import os
+import gc
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common
+common.DEBUG = False
+from syntax import get_syntax_tree
+from translator import translate
+
+
+def get_blocks(size):
+    return 'def main() { int a; a = 0; %s%s }' % (
+        'if (a < 1000) { a = a + 1; ' * size, '}' * size
+    )
+
+
+def get_parentheses(size):
+    return 'def main() { int a; a = 0; a = %s0%s; print a; }' % (
+        '(a + ' * size, ')' * size
+    )
+
+
+def get_chain(size):
+    return 'def main() { int a; a = 0; %s print a; }' % (
+        'a = a * 2 + 1; ' * size
+    )
+
+
+PROGRAMS = [
+    ('blocks', get_blocks), ('parentheses', get_parentheses),
+    ('chain', get_chain)
+]
+
+
+def timed(code):
+    tree = get_syntax_tree(code)
+    gc.disable()
+    try:
+        start = time.process_time()
+        instructions = len(translate(tree))
+        return instructions, time.process_time() - start
+    finally:
+        gc.enable()
+
+
+def measure(code):
+    # best of three, parsing excluded
+    return min(timed(code) for i in range(3))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print('%-12s %8s %12s %8s %10s' % (
+        '', 'size', 'instructions', 'time s', 'us / inst'
+    ))
+    for name, get_program in PROGRAMS:
+        for factor in [1, 2, 4, 8]:
+            instructions, elapsed = measure(get_program(size * factor))
+            print('%-12s %8d %12d %8.3f %10.2f' % (
+                name, size * factor, instructions, elapsed,
+                elapsed / instructions * 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main()
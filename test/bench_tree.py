@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# peak memory and time of building the syntax tree of a generated
+# program, against nodes and tokens shaped as before __slots__: every
+# instance with a __dict__ over class defaults, every node with its own
+# children list and properties dict
+#
+#     python3 test/bench_tree.py [functions]
+
+
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common
+common.DEBUG = False
+import scanner
+import syntax
+from translator import translate
+
+
+FUNCTION = '''def f%d(int a, int b) -> int {
+    int c;
+    int d;
+    c = (a + b) * 2 - a / (b + 1);
+    d = 0;
+    while (d < c && (c != 3 || d <= 100)) {
+        d = d + 1;
+        if (d / 2 * 2 == d) { c = c - 1; } else { print d; }
+    }
+    return c + d * a;
+}
+'''
+
+
+def get_program(functions):
+    return ''.join(FUNCTION % i for i in range(functions)) + (
+        'def main() { print f0(1, 2); }\n'
+    )
+
+
+def without_slots(cls, init, defaults):
+    # cls with a per-instance __dict__ in place of __slots__
+    return type(cls.__name__, (), {
+        name: value for name, value in vars(cls).items()
+        if name not in (*cls.__slots__, '__slots__', '__init__')
+    } | defaults | {'__init__': init})
+
+
+def init_node(self, syntax_item):
+    self.syntax_item = syntax_item
+    self.children = []
+    self.properties = {}
+    if syntax_item == 'Function':
+        self.function = self
+
+
+def init_token(self, token_type, string, pos, positions=None):
+    self.token_type = token_type
+    self.string = string
+    self.pos = pos
+    self.positions = positions
+
+
+BASELINE = {
+    (syntax, 'SyntaxTreeNode'): without_slots(
+        syntax.SyntaxTreeNode, init_node, {
+            'parent': None, 'token': None, 'function': None,
+            'processed': False, 'pending': 0, 'deriv_tuple': ()
+        }
+    ),
+    (scanner, 'Token'): without_slots(scanner.Token, init_token, {})
+}
+
+
+def measure(code):
+    # time without tracing, best of three
+    syntax.get_syntax_tree(get_program(1)) # build the parser
+    elapsed = min(timed(code) for i in range(3))
+    tracemalloc.start()
+    tree = syntax.get_syntax_tree(code)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    listing = [str(inst) for inst in translate(tree)]
+    return peak, elapsed, listing
+
+
+def timed(code):
+    start = time.perf_counter()
+    syntax.get_syntax_tree(code)
+    return time.perf_counter() - start
+
+
+def measure_baseline(code):
+    saved = {key: getattr(*key) for key in BASELINE}
+    for (module, name), cls in BASELINE.items():
+        setattr(module, name, cls)
+    try:
+        return measure(code)
+    finally:
+        for (module, name), cls in saved.items():
+            setattr(module, name, cls)
+
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    code = get_program(functions)
+    print('%d functions, %d KB of code' % (functions, len(code) // 1024))
+    # each in a fresh process, so neither runs on the heap of the other
+    with ProcessPoolExecutor(1) as executor:
+        base_peak, base_time, base_listing = executor.submit(
+            measure_baseline, code
+        ).result()
+    with ProcessPoolExecutor(1) as executor:
+        peak, elapsed, listing = executor.submit(measure, code).result()
+    assert listing == base_listing, 'translations differ'
+    print('%-10s %10s %10s' % ('', 'peak MB', 'time s'))
+    print('%-10s %10.1f %10.2f' % ('__dict__', base_peak / 2**20, base_time))
+    print('%-10s %10.1f %10.2f' % ('__slots__', peak / 2**20, elapsed))
+    print('%-10s %9.0f%% %9.0f%%' % (
+        'saved', 100 - 100 * peak / base_peak,
+        100 - 100 * elapsed / base_time
+    ))
+
+
+if __name__ == '__main__':
+    main()
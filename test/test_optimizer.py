@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import io
+import unittest
+import contextlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common
+common.DEBUG = False
+from machine import Machine, Instruction, Argument
+from syntax import get_syntax_tree
+from translator import translate
+from optimizer import (
+    optimize, peephole, goto_next, unused_label, merge_labels, unreachable,
+    mov_copy, calc_target, split_procs, eliminate_tail_calls, optimize_loops,
+    rename_webs, number_values, allocate_temps, is_temp, JUMPS, CALLS,
+    INLINE_SIZE
+)
+
+
+class DepthStack(list):
+    # a call stack remembering its greatest depth
+    depth = 0
+    def append(self, frame):
+        super().append(frame)
+        self.depth = max(self.depth, len(self))
+
+
+def run(source, optimized=False, machine=None):
+    code = translate(get_syntax_tree(source))
+    if optimized:
+        code = optimize(code)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        (machine or Machine()).run(code)
+    return output.getvalue()
+
+
+# commands whose arguments are names of labels and procedures
+NAMED = ['label', 'goto', 'proc', 'end', 'call', 'tailcall']
+
+
+def get_arg(text):
+    # 1, 1.5 and True are data, x an int variable, x:double a double one
+    name, _, ident_type = text.partition(':')
+    if name in ['True', 'False']:
+        return Argument('data', 'bool', name == 'True')
+    for data_type, convert in [('int', int), ('double', float)]:
+        try:
+            return Argument('data', data_type, convert(name))
+        except ValueError:
+            pass
+    return Argument('ident', ident_type or 'int', name)
+
+
+def parse(listing):
+    # instructions from a listing as str prints them
+    code = []
+    for line in listing.strip().splitlines():
+        cmd, *args = line.split()
+        if cmd == 'alloc':
+            args = [args[0], args[1], get_arg(args[2])]
+        elif cmd not in NAMED:
+            args = [get_arg(arg) for arg in args]
+            if cmd in JUMPS:
+                args[-1] = args[-1].ident
+        code.append(Instruction(cmd, *args))
+    return code
+
+
+def get_listing(code):
+    return '\n'.join(str(inst) for inst in code)
+
+
+class DeadDivisionTest(unittest.TestCase):
+    # a division whose value is not needed still fails on 0
+
+    def check_fails(self, source):
+        for optimized in [False, True]:
+            with self.assertRaises(ZeroDivisionError):
+                run(source, optimized)
+
+    def test_divisor_propagated(self):
+        self.check_fails('def main() { int z; z = 0; eval 1 / z; print 5; }')
+
+    def test_divisor_literal(self):
+        self.check_fails('def main() { eval 1 / 0; print 5; }')
+
+    def test_nonzero_divisor_removed(self):
+        source = 'def main() { int z; z = 2; eval 1 / z; print 5; }'
+        self.assertEqual(run(source), '5\n')
+        self.assertEqual(run(source, True), '5\n')
+        code = optimize(translate(get_syntax_tree(source)))
+        self.assertNotIn('div', [inst.cmd for inst in code])
+
+
+
+class PeepholeTest(unittest.TestCase):
+    # each rule alone rewrites a short listing
+
+    def check_rule(self, rule, before, after):
+        code, removed = peephole(parse(before), [rule])
+        self.assertEqual(get_listing(code), get_listing(parse(after)))
+        self.assertEqual(
+            removed[rule.__name__],
+            len(before.strip().splitlines()) - len(after.strip().splitlines())
+        )
+
+    def test_goto_next(self):
+        self.check_rule(goto_next, '''
+            proc f
+            goto L1
+            label L0
+            label L1
+            ret
+            end f
+        ''', '''
+            proc f
+            label L0
+            label L1
+            ret
+            end f
+        ''')
+
+    def test_unused_label(self):
+        self.check_rule(unused_label, '''
+            proc f
+            label L0
+            label L1
+            goto L1
+            end f
+        ''', '''
+            proc f
+            label L1
+            goto L1
+            end f
+        ''')
+
+    def test_merge_labels(self):
+        self.check_rule(merge_labels, '''
+            proc f
+            goto L1
+            label L0
+            label L1
+            goto L0
+            end f
+        ''', '''
+            proc f
+            goto L0
+            label L0
+            goto L0
+            end f
+        ''')
+
+    def test_unreachable(self):
+        self.check_rule(unreachable, '''
+            proc f
+            ret
+            ret
+            print 1
+            label L0
+            print 2
+            ret
+            end f
+        ''', '''
+            proc f
+            ret
+            label L0
+            print 2
+            ret
+            end f
+        ''')
+
+    def test_mov_copy(self):
+        self.check_rule(mov_copy, '''
+            proc f
+            alloc int x 0
+            call g
+            mov _t0 _getval
+            mov x _t0
+            print x
+            mov _t1 _getval
+            mov x _t1
+            print _t1
+            ret
+            end f
+        ''', '''
+            proc f
+            alloc int x 0
+            call g
+            mov x _getval
+            print x
+            mov _t1 _getval
+            mov x _t1
+            print _t1
+            ret
+            end f
+        ''')
+
+    def test_calc_target(self):
+        self.check_rule(calc_target, '''
+            proc f
+            alloc int y 0
+            plus _t0 y 1
+            mov y _t0
+            plus _t1 y 1
+            mov g _t1
+            mul _t2 y 2.5
+            mov y _t2:double
+            ret
+            end f
+        ''', '''
+            proc f
+            alloc int y 0
+            plus y y 1
+            plus _t1 y 1
+            mov g _t1
+            mul _t2 y 2.5
+            mov y _t2
+            ret
+            end f
+        ''')
+
+
+
+INLINED = '''
+def twice(int n) -> int { return n * 2; }
+def fact(int n) -> int { if (n < 2) { return 1; } return n * fact(n - 1); }
+def big(int n) -> int {
+    int a;
+    a = n + 1; a = a * 3; a = a - n; a = a * a; a = a + 7; a = a * n;
+    return a;
+}
+def main() { print twice(4); print fact(5); print big(3); }
+'''
+
+
+def get_calls(code, inline_size=INLINE_SIZE):
+    # {procedure: procedures it calls} after optimizing
+    return {
+        name: [inst.arg1 for inst in insts if inst.cmd in CALLS]
+        for name, insts in split_procs(optimize(code, inline_size=inline_size))
+        if name is not None
+    }
+
+
+class InlineTest(unittest.TestCase):
+    # small procedures that do not call themselves are substituted
+
+    def setUp(self):
+        self.code = translate(get_syntax_tree(INLINED))
+
+    def test_calls(self):
+        calls = get_calls(self.code)
+        # fact calls itself, big is longer than INLINE_SIZE
+        self.assertEqual(calls['main'], ['fact', 'big'])
+        self.assertEqual(calls['fact'], ['fact'])
+        self.assertNotIn('twice', calls)
+
+    def test_size(self):
+        calls = get_calls(self.code, inline_size=100)
+        self.assertEqual(calls['main'], ['fact'])
+        self.assertNotIn('big', calls)
+        calls = get_calls(self.code, inline_size=0)
+        self.assertEqual(calls['main'], ['twice', 'fact', 'big'])
+
+    def test_output(self):
+        self.assertEqual(run(INLINED), '8\n120\n264\n')
+        self.assertEqual(run(INLINED, True), '8\n120\n264\n')
+
+
+
+TAIL_CALLS = '''
+def count(int n, int s) -> int {
+    if (n == 0) { return s; }
+    return count(n - 1, s + 1);
+}
+def first(int n) -> int { print n; return count(n, 0); }
+def main() { print first(5000); }
+'''
+
+
+class TailCallTest(unittest.TestCase):
+    # a call whose value is returned right away reuses the frame
+
+    def check_lowering(self, before, after):
+        code = eliminate_tail_calls(parse(before), {'L0'})
+        self.assertEqual(get_listing(code), get_listing(parse(after)))
+
+    def test_self(self):
+        self.check_lowering('''
+            proc f
+            alloc int _retval 0
+            alloc int n 0
+            mov n _arg0
+            goto_eq n 0 L0
+            minus _t0 n 1
+            override _arg0 _t0
+            call f
+            mov _t0 _getval
+            mov _retval _t0
+            ret
+            label L0
+            mov _retval 0
+            ret
+            end f
+        ''', '''
+            proc f
+            label f_entry
+            alloc int _retval 0
+            alloc int n 0
+            mov n _arg0
+            goto_eq n 0 L0
+            minus _t0 n 1
+            override _arg0 _t0
+            goto f_entry
+            label L0
+            mov _retval 0
+            ret
+            end f
+        ''')
+
+    def test_other(self):
+        self.check_lowering('''
+            proc f
+            alloc int _retval 0
+            override _arg0 1
+            call g
+            mov _retval _getval
+            ret
+            end f
+        ''', '''
+            proc f
+            alloc int _retval 0
+            override _arg0 1
+            tailcall g
+            end f
+        ''')
+
+    def test_void(self):
+        self.check_lowering('''
+            proc f
+            print 1
+            call g
+            ret
+            end f
+        ''', '''
+            proc f
+            print 1
+            tailcall g
+            end f
+        ''')
+
+    def test_not_tail(self):
+        for listing in [
+            # the value is used after the call
+            '''
+            proc f
+            alloc int _retval 0
+            call g
+            mov _t0 _getval
+            plus _t1 _t0 1
+            mov _retval _t1
+            ret
+            end f
+            ''',
+            # the value is converted to the return type
+            '''
+            proc f
+            alloc double _retval 0.0
+            call g
+            mov _t0 _getval
+            mov _retval:double _t0
+            ret
+            end f
+            ''',
+            # something is left to do after the call
+            '''
+            proc f
+            call g
+            print 1
+            ret
+            end f
+            '''
+        ]:
+            with self.subTest(listing):
+                self.check_lowering(listing, listing)
+
+    def test_depth(self):
+        machine = Machine()
+        machine.call_stack = DepthStack(machine.call_stack)
+        self.assertEqual(run(TAIL_CALLS, True, machine), '5000\n5000\n')
+        # the frames of main and first, count runs in the frame of first
+        self.assertEqual(machine.call_stack.depth, 3)
+        machine = Machine()
+        machine.call_stack = DepthStack(machine.call_stack)
+        self.assertEqual(run(TAIL_CALLS, False, machine), '5000\n5000\n')
+        self.assertGreater(machine.call_stack.depth, 5000)
+
+
+
+class LoopTest(unittest.TestCase):
+    # invariant calculations leave loops, multiplications by the
+    # induction variable become additions and the exit test reads them
+
+    def check_loops(self, before, after):
+        code = optimize_loops(parse(before))
+        self.assertEqual(get_listing(code), get_listing(parse(after)))
+
+    def check_unchanged(self, listing):
+        # but for the temps named by their webs
+        code = parse(listing)
+        rename_webs(code)
+        self.check_loops(listing, get_listing(code))
+
+    def test_invariant(self):
+        self.check_loops('''
+            proc main
+            alloc int i 0
+            alloc int a 0
+            alloc int b 0
+            read a
+            read b
+            mov i 0
+            label L0
+            lt _t0 i 10
+            goto_if_false _t0 L1
+            mul _t1 a b
+            plus _t2 _t1 i
+            print _t2
+            plus i i 1
+            goto L0
+            label L1
+            exit
+            end main
+        ''', '''
+            proc main
+            alloc int i 0
+            alloc int a 0
+            alloc int b 0
+            read a
+            read b
+            mov i 0
+            mul _tw1 a b
+            label L0
+            lt _tw0 i 10
+            goto_if_false _tw0 L1
+            plus _tw2 _tw1 i
+            print _tw2
+            plus i i 1
+            goto L0
+            label L1
+            exit
+            end main
+        ''')
+
+    def test_countdown(self):
+        # i is not read but by its update and the test, so both go
+        self.check_loops('''
+            proc main
+            alloc int i 0
+            mov i 10
+            label L0
+            goto_le i 0 L1
+            mul _t0 i 4
+            print _t0
+            minus i i 1
+            goto L0
+            label L1
+            exit
+            end main
+        ''', '''
+            proc main
+            alloc int i 0
+            mov _tiv 40
+            label L0
+            goto_le _tiv 0 L1
+            print _tiv
+            plus _tiv _tiv -4
+            goto L0
+            label L1
+            exit
+            end main
+        ''')
+
+    def test_test_kept(self):
+        # i is printed as well, so it still counts and the test reads it
+        self.check_loops('''
+            proc main
+            alloc int i 0
+            mov i 0
+            label L0
+            goto_ge i 10 L1
+            mul _t0 i 3
+            print _t0
+            print i
+            plus i i 1
+            goto L0
+            label L1
+            exit
+            end main
+        ''', '''
+            proc main
+            alloc int i 0
+            mov i 0
+            mov _tiv 0
+            label L0
+            goto_ge i 10 L1
+            print _tiv
+            print i
+            plus i i 1
+            plus _tiv _tiv 3
+            goto L0
+            label L1
+            exit
+            end main
+        ''')
+
+    def test_overflow(self):
+        # 100001 * 40000 does not fit in 32 bits, 50001 * 40000 does
+        loop = '''
+            proc main
+            alloc int i 0
+            alloc int s 0
+            mov i 0
+            mov s 0
+            label L0
+            goto_ge i %d L1
+            mul _t0 i 40000
+            plus s s _t0
+            plus i i 1
+            goto L0
+            label L1
+            print s
+            exit
+            end main
+        '''
+        self.check_unchanged(loop % 100000)
+        code = get_listing(optimize_loops(parse(loop % 50000)))
+        self.assertNotIn('mul', code)
+        self.assertIn('plus _tiv _tiv 40000', code)
+
+    def test_no_preheader(self):
+        # the block in front of the loop jumps to its header
+        self.check_unchanged('''
+            proc main
+            alloc int i 0
+            alloc int a 0
+            read a
+            mov i 0
+            goto_eq a 0 L0
+            label L0
+            goto_ge i 10 L1
+            mul _t0 a 2
+            plus _t1 _t0 i
+            print _t1
+            plus i i 1
+            goto L0
+            label L1
+            exit
+            end main
+        ''')
+
+    def test_output(self):
+        source = '''def main() {
+            int i; int a;
+            i = 10; a = 7;
+            while (i > 0) { print i * 4 + a * 2; i = i - 1; }
+        }'''
+        self.assertEqual(run(source, True), run(source))
+
+
+
+class ValueNumberingTest(unittest.TestCase):
+    # a calculation repeated on operands holding the same values is read
+    # from the first temp, its own temp is left dead
+
+    def check_block(self, before, after):
+        block = parse(before)
+        number_values(block, {'a', 'b', 'x'})
+        self.assertEqual(get_listing(block), get_listing(parse(after)))
+
+    def test_shared(self):
+        self.check_block('''
+            mul _t0 a b
+            print _t0
+            mul _t1 b a
+            print _t1
+            plus _t2 a b
+            mul _t3 a b
+            plus _t4 _t3 _t2
+            print _t4
+        ''', '''
+            mul _t0 a b
+            print _t0
+            mul _t1 b a
+            print _t0
+            plus _t2 a b
+            mul _t3 a b
+            plus _t4 _t0 _t2
+            print _t4
+        ''')
+
+    def test_variable(self):
+        # x holds the value already, the second write goes
+        self.check_block('''
+            plus x a 1
+            plus x a 1
+            print x
+        ''', '''
+            plus x a 1
+            print x
+        ''')
+
+    def test_operand_written(self):
+        listing = '''
+            mul _t0 a b
+            print _t0
+            read a
+            mul _t1 a b
+            print _t1
+            mov b 2
+            mul _t2 a b
+            print _t2
+        '''
+        self.check_block(listing, listing)
+
+    def test_holder_written(self):
+        listing = '''
+            mul _t0 a b
+            mul _t1 a b
+            mov _t0 1
+            print _t1
+            mul _t2 a b
+            print _t2
+        '''
+        self.check_block(listing, listing)
+
+    def test_call(self):
+        # the callee may write the global g, not the local a
+        self.check_block('''
+            plus _t0 a 1
+            call f
+            plus _t1 a 1
+            print _t1
+            plus _t2 g 1
+            call f
+            plus _t3 g 1
+            print _t3
+        ''', '''
+            plus _t0 a 1
+            call f
+            plus _t1 a 1
+            print _t0
+            plus _t2 g 1
+            call f
+            plus _t3 g 1
+            print _t3
+        ''')
+
+
+
+def get_temps(code):
+    return {
+        arg.ident for inst in code
+        for arg in [inst.arg1, inst.arg2, inst.arg3] if is_temp(arg)
+    }
+
+
+class AllocateTempsTest(unittest.TestCase):
+    # temps live at the same time keep apart, the others share
+
+    def test_listing(self):
+        code = allocate_temps(parse('''
+            proc f
+            alloc int a 0
+            read a
+            mul _t0 a 2
+            mul _t1 a 3
+            plus _t2 _t0 _t1
+            print _t2
+            plus _t3 a 1
+            mov _t4 _t3
+            minus _t5 _t4 _t2
+            print _t5
+            ret
+            end f
+        '''))
+        # _t2 lives along _t3 and _t4, the copy of _t3 goes
+        self.assertEqual(get_listing(code), get_listing(parse('''
+            proc f
+            alloc int a 0
+            read a
+            mul _t0 a 2
+            mul _t1 a 3
+            plus _t0 _t0 _t1
+            print _t0
+            plus _t1 a 1
+            minus _t0 _t1 _t0
+            print _t0
+            ret
+            end f
+        ''')))
+
+    def test_program(self):
+        source = '''
+        def f(int a) -> int {
+            return (a + 1) * (a + 2) - (a + 3) * (a + 4) + (a + 5) * a;
+        }
+        def main() { print f(3); print f(7); }
+        '''
+        def get_f():
+            return split_procs(translate(get_syntax_tree(source)))[0][1]
+        # ten webs, four temps as the translator reuses them, three after
+        self.assertEqual(len(rename_webs(get_f())), 10)
+        self.assertEqual(len(get_temps(get_f())), 4)
+        self.assertEqual(len(get_temps(allocate_temps(get_f()))), 3)
+        self.assertEqual(run(source, True), run(source))
+
+
+if __name__ == '__main__':
+    unittest.main()
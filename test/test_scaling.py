@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common
+common.DEBUG = False
+from syntax import SyntaxTreeNode, get_syntax_tree
+
+
+def get_program(decls, stmts):
+    return 'def main() { %s %s }' % (
+        ' '.join('int a%d;' % i for i in range(decls)),
+        ' '.join('a0 = %d;' % i for i in range(stmts))
+    )
+
+
+class CountedSlot:
+    # a slot of SyntaxTreeNode that counts how often it is used
+    def __init__(self, name):
+        self.name = name
+        self.slot = getattr(SyntaxTreeNode, name)
+        self.count = 0
+    def __get__(self, node, owner=None):
+        if node is None:
+            return self
+        self.count += 1
+        return self.slot.__get__(node, owner)
+    def __set__(self, node, value):
+        self.count += 1
+        self.slot.__set__(node, value)
+
+
+class CompletionScalingTest(unittest.TestCase):
+    # tracking which nodes are complete takes steps in proportion to the
+    # length of Decls and Stmts chains
+
+    def setUp(self):
+        self.slots = [CountedSlot('processed'), CountedSlot('pending')]
+        for slot in self.slots:
+            setattr(SyntaxTreeNode, slot.name, slot)
+
+    def tearDown(self):
+        for slot in self.slots:
+            setattr(SyntaxTreeNode, slot.name, slot.slot)
+
+    def count_steps(self, decls, stmts):
+        for slot in self.slots:
+            slot.count = 0
+        get_syntax_tree(get_program(decls, stmts))
+        return sum(slot.count for slot in self.slots)
+
+    def check_linear(self, make_program):
+        small = self.count_steps(*make_program(500))
+        large = self.count_steps(*make_program(4000))
+        self.assertLess(large / small, 8 * 1.1)
+
+    def test_decls(self):
+        self.check_linear(lambda n: (n, 1))
+
+    def test_stmts(self):
+        self.check_linear(lambda n: (1, n))
+
+
+if __name__ == '__main__':
+    unittest.main()
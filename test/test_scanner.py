@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scanner
+from scanner import IncrementalScanner, InvalidTokenException, get_tokens
+
+
+UNIT = 'def f%d(int a, int b) {\n    int c; c = a + b * 2; /* c */ print c;\n}\n'
+PIECES = [
+    '/*', '*/', '*', '**', '/', '//', '\n', ' ', '"', '"a"', 'int', 'integer',
+    'do', 'double', '1', '1.5', 'e', '0x1F', ';', '{', '}', 'x', '@'
+]
+
+
+def get_program(size):
+    return ''.join(UNIT % i for i in range(size))
+
+
+def full_scan(code, skip_trivia, engine):
+    try:
+        return [
+            (t.token_type, t.string, t.pos, t.coor)
+            for t in get_tokens(code, skip_trivia, engine)
+        ]
+    except InvalidTokenException:
+        return None
+
+
+class TokenTest(unittest.TestCase):
+    # continue is a keyword and the two-character comparisons are one
+    # token each, by either engine
+
+    def check_tokens(self, code, expected):
+        for engine in ['regex', 'dfa']:
+            with self.subTest(engine):
+                self.assertEqual([
+                    (token.token_type, token.string)
+                    for token in get_tokens(code, True, engine)
+                ], expected)
+
+    def test_comparisons(self):
+        self.check_tokens('a<=b>=c!=d==e<f>g', [
+            ('ident', 'a'), ('op', '<='), ('ident', 'b'), ('op', '>='),
+            ('ident', 'c'), ('op', '!='), ('ident', 'd'), ('op', '=='),
+            ('ident', 'e'), ('op', '<'), ('ident', 'f'), ('op', '>'),
+            ('ident', 'g')
+        ])
+
+    def test_split_comparisons(self):
+        self.check_tokens('a < = b ! = c', [
+            ('ident', 'a'), ('op', '<'), ('op', '='), ('ident', 'b'),
+            ('op', '!'), ('op', '='), ('ident', 'c')
+        ])
+
+    def test_continue(self):
+        self.check_tokens('continue; contin', [
+            ('cond_key', 'continue'), ('op', ';'), ('ident', 'contin')
+        ])
+
+
+class IncrementalScannerTest(unittest.TestCase):
+    # edits patch the tokens to what a full scan gives
+
+    def setUp(self):
+        # small chunks and blocks, so that edits cross them
+        self.sizes = (scanner.CHUNK, scanner.BLOCK)
+        scanner.CHUNK = 7
+        scanner.BLOCK = 3
+
+    def tearDown(self):
+        scanner.CHUNK, scanner.BLOCK = self.sizes
+
+    def check_edits(self, skip_trivia, engine):
+        rand = random.Random(1)
+        for i in range(20):
+            code = get_program(3)
+            tokens = IncrementalScanner(code, skip_trivia, engine)
+            for j in range(30):
+                offset = rand.randint(0, len(code))
+                deleted = rand.randint(0, min(6, len(code)-offset))
+                inserted = ''.join(
+                    rand.choice(PIECES) for k in range(rand.randint(0, 3))
+                )
+                new_code = code[:offset] + inserted + code[offset+deleted:]
+                expected = full_scan(new_code, skip_trivia, engine)
+                try:
+                    tokens.edit(offset, deleted, inserted)
+                    code = new_code
+                except InvalidTokenException:
+                    self.assertIsNone(expected)
+                self.assertEqual(tokens.code, code)
+                self.assertEqual(
+                    [(t.token_type, t.string, t.pos, t.coor) for t in tokens],
+                    full_scan(code, skip_trivia, engine)
+                )
+
+    def test_regex(self):
+        self.check_edits(False, 'regex')
+
+    def test_regex_skip_trivia(self):
+        self.check_edits(True, 'regex')
+
+    def test_dfa(self):
+        self.check_edits(False, 'dfa')
+
+    def test_comment_closed_later(self):
+        code = 'int a; /* int b; int c;'
+        tokens = IncrementalScanner(code)
+        tokens.edit(len(code), 0, ' */')
+        self.assertEqual(
+            [t.token_type for t in tokens],
+            ['type_key', 'space', 'ident', 'op', 'space', 'comment']
+        )
+
+
+class EditCostTest(unittest.TestCase):
+    # an edit scans a window around it, whatever the size of code
+
+    def scanned(self, size, offset):
+        windows = []
+        get_spans = scanner.get_spans
+        def recorded(code, *args):
+            windows.append(len(code))
+            return get_spans(code, *args)
+        tokens = IncrementalScanner(get_program(size))
+        scanner.get_spans = recorded
+        try:
+            result = tokens.edit(offset, 1, 'xy')
+        finally:
+            scanner.get_spans = get_spans
+        return result[1:], sum(windows)
+
+    def test_window(self):
+        offset = len(UNIT)*5 + UNIT.index('c;')
+        small = self.scanned(100, offset)
+        large = self.scanned(10000, offset)
+        self.assertEqual(small, large)
+        self.assertLess(large[1], 2*scanner.CHUNK)
+
+
+if __name__ == '__main__':
+    unittest.main()
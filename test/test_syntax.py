@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common
+common.DEBUG = False
+from scanner import get_tokens
+from syntax import get_syntax_tree
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SlotsTest(unittest.TestCase):
+    # syntax tree nodes and tokens keep their fields in __slots__
+
+    def setUp(self):
+        with open(os.path.join(TEST_DIR, 'test6')) as f:
+            self.code = f.read()
+
+    def test_tokens(self):
+        for token in get_tokens(self.code):
+            self.assertFalse(hasattr(token, '__dict__'))
+
+    def test_nodes(self):
+        stack = [get_syntax_tree(self.code)]
+        count = 0
+        while stack:
+            node = stack.pop()
+            count += 1
+            self.assertFalse(hasattr(node, '__dict__'))
+            if node.token:
+                self.assertFalse(hasattr(node.token, '__dict__'))
+            stack.extend(node.children)
+        self.assertGreater(count, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
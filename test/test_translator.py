@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common
+common.DEBUG = False
+import translator
+from scanner import get_tokens
+from syntax import SyntaxTreeNode, get_syntax_tree
+from translator import translate
+from bench_translate import PROGRAMS
+from test_scaling import CountedSlot
+from test_optimizer import run
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_listing(code):
+    return [str(inst) for inst in translate(get_syntax_tree(code))]
+
+
+class ListingTest(unittest.TestCase):
+    # the sample programs translate to the instructions in order, as
+    # stored next to them in .code files
+
+    def check_listing(self, name):
+        path = os.path.join(TEST_DIR, name)
+        with open(path) as f:
+            code = f.read()
+        with open(path + '.code') as f:
+            listing = f.read().splitlines()
+        self.assertEqual(get_listing(code), listing)
+
+    def test_test5(self):
+        self.check_listing('test5')
+
+    def test_test6(self):
+        self.check_listing('test6')
+
+
+class LinearTranslationTest(unittest.TestCase):
+    # node visits and instructions made per input token do not grow with
+    # nesting or length
+
+    def setUp(self):
+        self.children = CountedSlot('children')
+        setattr(SyntaxTreeNode, 'children', self.children)
+        self.instruction = translator.Instruction
+        self.instructions = 0
+        def counted(*args):
+            self.instructions += 1
+            return self.instruction(*args)
+        translator.Instruction = counted
+
+    def tearDown(self):
+        setattr(SyntaxTreeNode, 'children', self.children.slot)
+        translator.Instruction = self.instruction
+
+    def count_steps(self, code):
+        tree = get_syntax_tree(code)
+        self.children.count = 0
+        self.instructions = 0
+        code_length = len(translate(tree))
+        tokens = len(list(get_tokens(code, skip_trivia=True)))
+        return (
+            self.children.count / tokens, self.instructions / tokens,
+            code_length / tokens
+        )
+
+    def test_programs(self):
+        for name, get_program in PROGRAMS:
+            with self.subTest(name):
+                small = self.count_steps(get_program(250))
+                large = self.count_steps(get_program(2000))
+                for small_steps, large_steps in zip(small, large):
+                    self.assertLess(large_steps, small_steps * 1.1)
+
+
+
+SHORT_CIRCUIT = '''
+def yes(int n) -> int { print n; return 1; }
+def no(int n) -> int { print n; return 0; }
+def main() {
+    int i;
+    if (no(1) == 1 && yes(2) == 1) { print 10; }
+    if (yes(3) == 1 || no(4) == 1) { print 20; }
+    if (yes(5) == 1 && no(6) == 1) { print 30; } else { print 31; }
+    if (no(7) == 1 || no(8) == 1) { print 40; }
+    i = 0;
+    while (i < 3 && yes(i) == 1) { i = i + 1; }
+    for (i = 0; no(50) == 1 || i < 2; i = i + 1) { print i; }
+}
+'''
+
+
+class ConditionTest(unittest.TestCase):
+    # conditions jump as soon as their left side decides them, relations
+    # branch on their operands
+
+    def test_short_circuit(self):
+        output = [1, 3, 20, 5, 6, 31, 7, 8, 0, 1, 2, 50, 0, 50, 1, 50]
+        expected = ''.join('%d\n' % line for line in output)
+        self.assertEqual(run(SHORT_CIRCUIT), expected)
+        self.assertEqual(run(SHORT_CIRCUIT, True), expected)
+
+    def test_relations(self):
+        # each relation jumping when true, as the left side of ||, and
+        # when false, as the whole condition or the left side of &&
+        conditions = [
+            '%s', '%s || a == 100', '%s && a == a'
+        ]
+        stmts = []
+        expected = []
+        for left, right in [(1, 2), (2, 2), (3, 2)]:
+            stmts.append('a = %d; b = %d; x = %d.0; y = %d.0;' % (
+                left, right, left, right
+            ))
+            for relation in ['<', '<=', '>', '>=', '==', '!=']:
+                holds = eval('%d %s %d' % (left, relation, right))
+                for operands in ['a %s b', 'x %s y']:
+                    for condition in conditions:
+                        stmts.append(
+                            'if (%s) { print 1; } else { print 0; }'
+                            % condition % (operands % relation)
+                        )
+                        expected.append('%d\n' % holds)
+        source = 'def main() { int a; int b; double x; double y; %s }' % (
+            ' '.join(stmts)
+        )
+        self.assertEqual(run(source), ''.join(expected))
+
+    def test_continue(self):
+        source = '''def main() {
+            int i;
+            i = 0;
+            while (i != 5) { i = i + 1; if (i == 3) { continue; } print i; }
+            for (i = 0; i <= 4; i = i + 1) { if (i >= 2) { continue; } print i; }
+        }'''
+        self.assertEqual(run(source), '1\n2\n4\n5\n0\n1\n')
+        self.assertEqual(
+            get_listing(source),
+            [str(inst) for inst in translate(get_syntax_tree(source, 'generated'))]
+        )
+
+    def test_double_not_negated(self):
+        # x < y false does not make x >= y true for a NaN, so a false
+        # test on doubles stores the relation and jumps on its value
+        listing = get_listing(
+            'def main() { int a; double x; if (a < 2) { print 1; } '
+            'if (x < 2.0) { print 2; } }'
+        )
+        self.assertIn('goto_ge a 2 L0', listing)
+        self.assertIn('lt _t0 x 2.0', listing)
+        self.assertIn('goto_if_false _t0 L2', listing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,15 @@
 
 
 import sys
-from syntax import get_syntax_tree
+from syntax import (
+    SyntaxTreeNode, get_syntax_tree, get_file_syntax_tree
+)
 from machine import (
-    Instruction, Argument, CALCULATION,
+    Instruction, Argument, CALCULATION, BRANCH, NEGATED,
     RETVAL, GETVAL, ARG_PREFIX, TEMP_PREFIX
 )
 from common import DEBUG, e_print
+from optimizer import optimize
 
 
 LABEL_PREFIX = 'L'
@@ -17,9 +20,34 @@ DEFAULT_VAL = {
     'double': Argument('data', 'double', 0.0),
     'bool': Argument('data', 'bool', False)
 }
+LOOPS = ['while', 'do', 'for']
+OPERATOR_INST = {
+    '*': 'mul', '/': 'div',
+    '+': 'plus', '-': 'minus',
+    '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge',
+    '==': 'eq', '!=': 'neq',
+    '&&': 'and', '||': 'or'
+}
+JUMP_INST = {cmd: branch for branch, cmd in BRANCH.items()}
 
 
-def translate(syntax_tree_root):
+def flatten_code(chunk):
+    code = []
+    stack = [iter(chunk)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, list):
+                stack.append(iter(item))
+                break
+            code.append(item)
+        else:
+            stack.pop()
+    return code
+
+
+def get_code_generator(label_prefix=LABEL_PREFIX):
+    # returns synthesis_code(node), labels and temps are numbered across
+    # all the calls so functions can be translated one at a time
     max_ident_index = -1
     max_label_index = -1
     released_idents_list = []
@@ -27,7 +55,7 @@ def translate(syntax_tree_root):
     def get_label():
         nonlocal max_label_index
         max_label_index += 1
-        return LABEL_PREFIX + str(max_label_index)
+        return label_prefix + str(max_label_index)
     def get_ident():
         nonlocal max_ident_index
         if released_idents_list:
@@ -47,11 +75,7 @@ def translate(syntax_tree_root):
             if ident == released_idents_list[-1]:
                 released_idents_list.pop()
                 del released_idents[ident]
-    def expand_code_list(code_list):
-        result = []
-        for code in code_list:
-            result += code
-        return result
+    pending_jumps = [] # (break or continue, goto) waiting for a loop
     def new_inst(cmd, *args):
         # parentheses and function calls could
         # break the order of calculation,
@@ -69,17 +93,101 @@ def translate(syntax_tree_root):
                         release_ident(arg.ident)
             first = False
         return Instruction(cmd, *args)
+    def synthesis_chunk(root):
+        # code is built as nested lists of instructions, a parent only
+        # refers to the code of its children instead of copying it;
+        # post-order over an explicit stack, a node is produced when
+        # the codes of all its children are on top of codes
+        codes = []
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            children = node.children
+            if not visited:
+                if node.syntax_item == 'Stmt' and node.deriv_tuple[0] in LOOPS:
+                    node.properties['jump_mark'] = len(pending_jumps)
+                if children:
+                    stack.append((node, True))
+                    for child in reversed(children):
+                        stack.append((child, False))
+                    continue
+            if children:
+                children_codes = codes[-len(children):]
+                del codes[-len(children):]
+            else:
+                children_codes = []
+            produce_code = produces.get(node.syntax_item)
+            if produce_code:
+                codes.append(produce_code(node, children_codes))
+            else:
+                codes.append(children_codes)
+        return codes[0]
     def synthesis_code(node):
-        children_codes = [synthesis_code(child) for child in node.children]
-        if hasattr(Produce, node.syntax_item):
-            produce_code = getattr(Produce, node.syntax_item)
-            return produce_code(node, children_codes)
-        else:
-            return expand_code_list(children_codes)
+        return flatten_code(synthesis_chunk(node))
+    def get_condition(node, code):
+        # how a jump tests node: ('test', cmd, left, right, code) for a
+        # relation, ('and' / 'or', left, right), ('not', condition) or
+        # ('value', arg, code) for anything else
+        condition = node.properties.get('condition')
+        if condition is None:
+            return ('value', node.properties['arg'], code)
+        return condition
+    def jump_code(expr_node, expr_code, label, sense):
+        # code jumping to label when the Expr is sense and falling through
+        # otherwise; && and || jump as soon as their left side decides,
+        # a relation branches on its operands, and the value of the Expr
+        # is not computed at all; an explicit stack like synthesis_chunk
+        condition = get_condition(expr_node, expr_code)
+        if condition[0] != 'value':
+            release_ident(expr_node.properties['arg'].ident)
+        code = []
+        stack = [(condition, label, sense)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                code.append(item)
+                continue
+            condition, label, sense = item
+            rule = condition[0]
+            if rule == 'value':
+                arg, arg_code = condition[1:]
+                cmd = 'goto_if' if sense else 'goto_if_false'
+                code.append([arg_code, new_inst(cmd, arg, label)])
+            elif rule == 'test':
+                cmd, left, right, operand_code = condition[1:]
+                code.append(operand_code)
+                if not sense and (
+                        cmd in ['eq', 'neq']
+                        or 'double' not in [left.data_type, right.data_type]
+                ):
+                    cmd = NEGATED[cmd]
+                    sense = True
+                if sense:
+                    code.append(new_inst(JUMP_INST[cmd], left, right, label))
+                else:
+                    temp = Argument('ident', 'bool', get_ident())
+                    code.append(new_inst(cmd, temp, left, right))
+                    code.append(new_inst('goto_if_false', temp, label))
+            elif rule == 'not':
+                stack.append((condition[1], label, not sense))
+            elif (rule == 'and') != sense:
+                # false && ... jumps when false, true || ... when true
+                stack.append((condition[2], label, sense))
+                stack.append((condition[1], label, sense))
+            else:
+                # the left side deciding the other way skips the right
+                skip = get_label()
+                stack.append([new_inst('label', skip)])
+                stack.append((condition[2], label, sense))
+                stack.append((condition[1], skip, not sense))
+        return code
     class Produce():
+        def Translated(node, children_codes):
+            # a Function translated while parsing
+            return node.properties['code']
         def Program(node, children_codes):
             return [
-                *expand_code_list(children_codes),
+                children_codes,
                 new_inst('start'),
                 new_inst('call', MAIN)
             ]
@@ -130,61 +238,60 @@ def translate(syntax_tree_root):
                 retval_code = []
             return [
                 new_inst('proc', name),
-                *retval_code,
-                *para_code,
-                *body_code,
-                *return_code,
+                retval_code,
+                para_code,
+                body_code,
+                return_code,
                 new_inst('end', name)
             ]
         def ReturnValue(node, children_codes):
             # ReturnValue -> ; | Expr;
             if node.deriv_tuple[0] == 'Expr':
                 node.properties['arg'] = node.children[0].properties['arg']
-            return expand_code_list(children_codes)
+            return children_codes
         def Stmt(node, children_codes):
             # Stmt -> Assign; | read Var; | print Expr; | eval Expr;
             #         if(Expr) Stmt Else | while(Expr) Stmt |
             #         do Stmt while(Expr); | for(Assign; Expr; Assign) Stmt |
             #         break; | continue; | return ReturnValue | Block
-            def enable_jump(code, continue_label, break_label):
-                for i in range(0, len(code)):
-                    if code[i] == 'continue':
-                        code[i] = new_inst('goto', continue_label)
-                    elif code[i] == 'break':
-                        code[i] = new_inst('goto', break_label)
+            def enable_jump(node, continue_label, break_label):
+                # the jumps left by the loop body since its pre-visit
+                mark = node.properties['jump_mark']
+                for rule, inst in pending_jumps[mark:]:
+                    if rule == 'continue':
+                        inst.arg1 = continue_label
+                    else:
+                        inst.arg1 = break_label
+                del pending_jumps[mark:]
             rule = node.deriv_tuple[0]
             if rule == 'if':
                 # if(Expr) Stmt Else
                 expr_node = node.children[2]
                 expr_code = children_codes[2]
-                expr_arg = expr_node.properties['arg']
                 stmt_code = children_codes[4]
                 else_code = children_codes[5]
                 label_pre_else = get_label()
                 label_post_else = get_label()
                 return [
-                    *expr_code,
-                    new_inst('goto_if_false', expr_arg, label_pre_else),
-                    *stmt_code,
+                    jump_code(expr_node, expr_code, label_pre_else, False),
+                    stmt_code,
                     new_inst('goto', label_post_else),
                     new_inst('label', label_pre_else),
-                    *else_code,
+                    else_code,
                     new_inst('label', label_post_else)
                 ]
             elif rule == 'while':
                 # while(Expr) Stmt
                 expr_node = node.children[2]
                 expr_code = children_codes[2]
-                expr_arg = expr_node.properties['arg']
                 stmt_code = children_codes[4]
                 label_go_back = get_label()
                 label_tail = get_label()
-                enable_jump(stmt_code, label_go_back, label_tail)
+                enable_jump(node, label_go_back, label_tail)
                 return [
                     new_inst('label', label_go_back),
-                    *expr_code,
-                    new_inst('goto_if_false', expr_arg, label_tail),
-                    *stmt_code,
+                    jump_code(expr_node, expr_code, label_tail, False),
+                    stmt_code,
                     new_inst('goto', label_go_back),
                     new_inst('label', label_tail)
                 ]
@@ -192,16 +299,14 @@ def translate(syntax_tree_root):
                 # do Stmt while(Expr);
                 expr_node = node.children[4]
                 expr_code = children_codes[4]
-                expr_arg = expr_node.properties['arg']
                 stmt_code = children_codes[1]
                 label_go_back = get_label()
                 label_tail = get_label()
-                enable_jump(stmt_code, label_go_back, label_tail)
+                enable_jump(node, label_go_back, label_tail)
                 return [
                     new_inst('label', label_go_back),
-                    *stmt_code,
-                    *expr_code,
-                    new_inst('goto_if', expr_arg, label_go_back),
+                    stmt_code,
+                    jump_code(expr_node, expr_code, label_go_back, True),
                     new_inst('label', label_tail)
                 ]
             elif rule == 'for':
@@ -209,28 +314,27 @@ def translate(syntax_tree_root):
                 initial_code = children_codes[2]
                 condition_node = node.children[4]
                 condition_code = children_codes[4]
-                condition_arg = condition_node.properties['arg']
                 increment_code = children_codes[6]
                 stmt_code = children_codes[8]
                 label_go_back = get_label()
                 label_tail = get_label()
-                enable_jump(stmt_code, label_go_back, label_tail)
+                enable_jump(node, label_go_back, label_tail)
                 return [
-                    *initial_code,
+                    initial_code,
                     new_inst('label', label_go_back),
-                    *condition_code,
-                    new_inst('goto_if_false', condition_arg, label_tail),
-                    *stmt_code,
-                    *increment_code,
+                    jump_code(
+                        condition_node, condition_code, label_tail, False
+                    ),
+                    stmt_code,
+                    increment_code,
                     new_inst('goto', label_go_back),
                     new_inst('label', label_tail)
                 ]
-            elif rule == 'break':
-                # to be handled in enable_jump()
-                return ['break']
-            elif rule == 'continue':
-                # to be handled in enable_jump()
-                return ['continue']
+            elif rule in ['break', 'continue']:
+                # the label is filled in by enable_jump()
+                inst = new_inst('goto', None)
+                pending_jumps.append((rule, inst))
+                return [inst]
             elif rule == 'return':
                 code = []
                 data_type = node.children[1].properties['data_type']
@@ -238,7 +342,7 @@ def translate(syntax_tree_root):
                     retval_arg = Argument('ident', data_type, RETVAL)
                     expr_arg = node.children[1].properties['arg']
                     expr_code = children_codes[1]
-                    code = [*code, *expr_code]
+                    code.append(expr_code)
                     code.append(new_inst('mov', retval_arg, expr_arg))
                 assert node.function
                 if node.function.properties['name'] == MAIN: 
@@ -256,9 +360,9 @@ def translate(syntax_tree_root):
                 # print Expr;
                 expr_code = children_codes[1]
                 expr_arg = node.children[1].properties['arg']
-                return [*expr_code, new_inst('print', expr_arg)]
+                return [expr_code, new_inst('print', expr_arg)]
             else:
-                return expand_code_list(children_codes)
+                return children_codes
         def Assign(node, children_codes):
             # Assign -> Var = Expr
             ident = node.children[0].properties['ident']
@@ -267,7 +371,7 @@ def translate(syntax_tree_root):
             expr_arg = node.children[2].properties['arg']
             expr_code = children_codes[2]
             return [
-                *expr_code,
+                expr_code,
                 new_inst('mov', var_arg, expr_arg)
             ]
         def Oprand(node, children_codes):
@@ -279,7 +383,7 @@ def translate(syntax_tree_root):
             else:
                 arg = Argument('data', data_type, child.token.string)
             node.properties['arg'] = arg
-            return expand_code_list(children_codes)
+            return children_codes
         def VarCall(node, children_codes):
             # VarCall -> ident VarCallRight
             code = []
@@ -293,7 +397,7 @@ def translate(syntax_tree_root):
                 pass
             elif var_type == 'call':
                 arglist_code = children_codes[1]
-                code = [*code, *arglist_code]
+                code.append(arglist_code)
                 code.append(new_inst('call', ident))
                 if data_type != 'void':
                     getval = Argument('ident', data_type, GETVAL)
@@ -315,18 +419,17 @@ def translate(syntax_tree_root):
             arg = expr_node.properties['arg']
             code = children_codes[0]
             args = node.properties['args'] = [arg, *right.properties['args']]
-            codes = [[*code], *children_codes[-1]]
+            codes = [code, *children_codes[-1]]
             types = node.properties['arg_types']
             for i in range(0, len(args)):
-                result_code = [
-                    *result_code,
-                    *codes[i],
+                result_code.append(codes[i])
+                result_code.append(
                     new_inst(
                         'override',
                         Argument('ident', types[i], ARG_PREFIX+str(i)),
                         args[i]
                     )
-                ]
+                )
             return result_code
         def ArgListRight(node, children_codes):
             # ArgListRight -> "" | ,Expr ArgListRight
@@ -339,11 +442,16 @@ def translate(syntax_tree_root):
                 arg = expr_node.properties['arg']
                 code = children_codes[1]
                 node.properties['args'] = [arg, *right.properties['args']]
-                return [[*code], *children_codes[-1]]
+                return [code, *children_codes[-1]]
         def ParExpr(node, children_codes):
             # ParExpr -> (Expr)
-            node.properties['arg'] = node.children[1].properties['arg']
-            return expand_code_list(children_codes)
+            expr_node = node.children[1]
+            node.properties['arg'] = expr_node.properties['arg']
+            if 'condition' in expr_node.properties:
+                node.properties['condition'] = (
+                    expr_node.properties['condition']
+                )
+            return children_codes
         def Unary(node, children_codes):
             # Unary -> {+, -, !} Unary | ParExpr | Oprand
             code = []
@@ -353,6 +461,10 @@ def translate(syntax_tree_root):
             data_type = node.properties['data_type']
             if op in ['ParExpr', 'Oprand', '+']:
                 node.properties['arg'] = oprand_arg
+                if op == 'ParExpr' and 'condition' in oprand.properties:
+                    node.properties['condition'] = (
+                        oprand.properties['condition']
+                    )
             elif op == '-':
                 temp = Argument('ident', data_type, get_ident())
                 zero = Argument('data', data_type, 0)                
@@ -362,111 +474,75 @@ def translate(syntax_tree_root):
                 temp = Argument('ident', data_type, get_ident())
                 code.append(new_inst('not', temp, oprand_arg))
                 node.properties['arg'] = temp
+                node.properties['condition'] = (
+                    'not', get_condition(oprand, children_codes[-1])
+                )
             else:
                 assert False
-            return expand_code_list(children_codes) + code
-        def HandleCalcItem(inst_of_op, left, right, node, children_codes):
-            # Xxx -> Item XxxRight
-            # XxxRight -> Op Item XxxRight
-            code = []
-            if (
-                    right.children
-#                and right.children[].syntax_item.startswith(node.syntax_item)
-            ):
-                op = right.properties['op']
-                right_arg = right.properties['arg']
-                left_arg = left.properties['arg']
-                data_type = node.properties['data_type']
-                temp = Argument('ident', data_type, get_ident())
-                code.append(
-                    new_inst(inst_of_op[op], temp, left_arg, right_arg)
+            return [children_codes, code]
+        def Binary(node, children_codes):
+            # Binary -> Oprand op Oprand, folded from Expr by precedence
+            left, op, right = node.children
+            cmd = OPERATOR_INST[op.token.string]
+            data_type = node.properties['data_type']
+            temp = Argument('ident', data_type, get_ident())
+            left_arg = left.properties['arg']
+            right_arg = right.properties['arg']
+            code = [new_inst(cmd, temp, left_arg, right_arg)]
+            node.properties['arg'] = temp
+            # kept for jump_code, which drops the code computing the value
+            if cmd in ['and', 'or']:
+                node.properties['condition'] = (
+                    cmd, get_condition(left, children_codes[0]),
+                    get_condition(right, children_codes[2])
                 )
-                node.properties['arg'] = temp
-                if node.deriv_tuple[0] in inst_of_op:
-                    node.properties['op'] = node.children[0].token.string
-                else:
-                    pass
-            else:
-                if node.deriv_tuple[0] in inst_of_op:
-                    node.properties['op'] = node.children[0].token.string
-                else:
-                    pass
-                node.properties['arg'] = left.properties['arg']
-            return expand_code_list(children_codes) + code
-        def HandleCalc(op_map, node, children_codes, r=False):
-            right = r
-            if not right:
-                # Xxx -> Item XxxRight
-                left = node.children[0]
-            elif node.children:
-                # XxxRight -> Op Item XxxRight
-                left = node.children[1]
-            else:
-                # XxxRight -> ""
-                return []
-            right = node.children[-1]
-            return Produce.HandleCalcItem(
-                op_map, left, right, node, children_codes
-            )
-        def Term(*args):
-            # Term -> Unary TermRight
-            return Produce.HandleCalc({'*':'mul', '/':'div'}, *args)
-        def TermRight(*args):
-            # TermRight -> "" | {*, /} Unary TermRight
-            return Produce.HandleCalc({'*':'mul', '/':'div'}, *args, r=True)
-        def Arith(*args):
-            # Arith -> Term ArithRight
-            return Produce.HandleCalc({'+':'plus', '-':'minus'}, *args)
-        def ArithRight(*args):
-            # TermRight -> "" | {*, /} Unary TermRight
-            return Produce.HandleCalc({'+':'plus', '-':'minus'}, *args, r=True)
-        def Rel(*args):
-            # Rel -> Airth RelRight
-            return Produce.HandleCalc(
-                {
-                    '<': 'lt', '>': 'gt',
-                    '<=': 'le', '>=': 'ge'
-                },
-                *args
-            )
-        def RelRight(*args):
-            # RelRight -> "" | {<, <=, >, >=} Arith RelRight
-            return Produce.HandleCalc(
-                {
-                    '<': 'lt', '>': 'gt',
-                    '<=': 'le', '>=': 'ge'
-                },
-                *args,
-                r = True
-            )
-        def Equality(*args):
-            # Equality -> Rel EqualityRight
-            return Produce.HandleCalc({'==':'eq', '!=':'neq'}, *args)
-        def EqualityRight(*args):
-            # EqualityRight -> "" | {==, !=} Rel EqualityRight
-            return Produce.HandleCalc({'==':'eq', '!=':'neq'}, *args, r=True)
-        def Join(*args):
-            # Join -> Equality JoinRight
-            return Produce.HandleCalc({'&&':'and'}, *args)
-        def JoinRight(*args):
-            # JoinRight -> "" | && Equality JoinRight
-            return Produce.HandleCalc({'&&':'and'}, *args, r=True)
-        def Expr(*args):
-            # Expr -> Join ExprRight
-            return Produce.HandleCalc({'||':'or'}, *args)
-        def ExprRight(*args):
-            # ExprRight -> "" | || Join ExprRight
-            return Produce.HandleCalc({'||':'or'}, *args, r=True)
+            elif cmd in JUMP_INST:
+                node.properties['condition'] = (
+                    'test', cmd, left_arg, right_arg, children_codes
+                )
+            return [children_codes, code]
+        def Expr(node, children_codes):
+            # Expr -> Unary | Binary
+            child = node.children[0]
+            node.properties['arg'] = child.properties['arg']
+            if 'condition' in child.properties:
+                node.properties['condition'] = child.properties['condition']
+            return children_codes
+    produces = {
+        name: f for name, f in vars(Produce).items()
+        if not name.startswith('__')
+    }
+    return synthesis_code
+
+
+def print_debug_code(code):
+    e_print('Translated Code:')
+    count = 0
+    for instruction in code:
+        e_print('%d: %s' % (count, instruction))
+        count += 1
+
+
+def translate(syntax_tree_root):
+    code = get_code_generator()(syntax_tree_root)
     if DEBUG:
-        code = synthesis_code(syntax_tree_root)
-        e_print('Translated Code:')
-        count = 0
-        for instruction in code:
-            e_print('%d: %s' % (count, instruction))
-            count += 1
-        return code
-    else:
-        return synthesis_code(syntax_tree_root)
+        print_debug_code(code)
+    return code
+
+
+def compile_file(file_name, engine='table'):
+    # translate every Function as soon as it is parsed and keep only
+    # its code in the tree
+    synthesis_code = get_code_generator()
+    def on_function(node):
+        translated = SyntaxTreeNode('Translated')
+        translated.properties['code'] = synthesis_code(node)
+        return translated
+    root = get_file_syntax_tree(file_name, engine, on_function)
+    code = synthesis_code(root)
+    if DEBUG:
+        print_debug_code(code)
+    return code
 
 
 def print_code(code):
@@ -474,20 +550,18 @@ def print_code(code):
         print(instruction)
 
         
-def process_file(file_name):
-    f = open(file_name, 'r')
-    root = get_syntax_tree(f.read())
-    code = translate(root)
+def process_file(file_name, optimized=False):
+    code = compile_file(file_name)
+    if optimized:
+        code = optimize(code)
     print_code(code)
-    f.close()
 
 
 def main():
-    first = True
-    for file_name in sys.argv:
-        if not first:
-            process_file(file_name)
-        first = False
+    optimized = '-O' in sys.argv[1:]
+    for file_name in sys.argv[1:]:
+        if file_name != '-O':
+            process_file(file_name, optimized)
 
 
 if __name__ == '__main__':